@@ -0,0 +1,63 @@
+"""Benchmarks FPFF.insert and FPFF.remove on FPFFs with many sections.
+
+Section tables backed by plain lists are timed alongside for comparison.
+
+Usage:
+    python -m benchmarks.bench_edit [--sections N] [--edits N]
+"""
+
+import argparse
+import time
+from py_fpff import FPFF, SectionType
+
+
+def bench(fpff: FPFF, where: str, edits: int) -> float:
+    """Times inserting and then removing sections.
+
+    Args:
+        fpff (FPFF): FPFF to edit. Left with its original sections.
+        where (str): Edit at 'front', 'middle' or 'tail'.
+        edits (int): Number of sections to insert and remove.
+
+    Returns:
+        float: Seconds taken.
+    """
+
+    start = time.perf_counter()
+    for _ in range(edits):
+        idx = {'front': 0, 'middle': fpff.nsects // 2, 'tail': fpff.nsects}[where]
+        fpff.insert(idx, SectionType.ASCII, 'a')
+    for _ in range(edits):
+        idx = {'front': 0, 'middle': fpff.nsects // 2, 'tail': fpff.nsects - 1}[where]
+        fpff.remove(idx)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, default=1_000_000)
+    parser.add_argument('--edits', type=int, default=10_000)
+    args = parser.parse_args()
+
+    fpff = FPFF()
+    fpff.splice(0, 0, [(SectionType.ASCII, 'a')] * args.sections)
+
+    baseline = FPFF()
+    # Bypass the setter, which would copy into a block list
+    baseline._sections = list(fpff.sections)
+
+    # Build reference indexes outside the timing
+    fpff.referrers(0)
+    baseline.referrers(0)
+
+    print(f'{args.sections} sections, {args.edits} inserts and removes')
+    print(f'{"where":<8}{"blocks us/op":>14}{"list us/op":>12}')
+    for where in ['front', 'middle', 'tail']:
+        t = bench(fpff, where, args.edits)
+        t_list = bench(baseline, where, args.edits)
+        ops = 2 * args.edits
+        print(f'{where:<8}{t / ops * 1e6:>14.2f}{t_list / ops * 1e6:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Benchmarks FPFF.export on FPFFs with many small sections.
+
+Usage:
+    python -m benchmarks.bench_export [--sections N] [--workers N ...]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from py_fpff import FPFF, SectionType
+
+
+def bench(fpff: FPFF, output_path: str, workers: int) -> float:
+    """Times one export.
+
+    Args:
+        fpff (FPFF): FPFF to export.
+        output_path (str): Path to export directory.
+        workers (int): Number of export threads, or None for sequential export.
+
+    Returns:
+        float: Seconds taken by FPFF.export.
+    """
+
+    # Keep clearing the previous export out of the timing
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+
+    start = time.perf_counter()
+    fpff.export(output_path, workers=workers)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, default=10_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8, 16])
+    parser.add_argument(
+        '--dir', default=None,
+        help='Directory to export into, e.g. on a network-backed disk.'
+    )
+    args = parser.parse_args()
+
+    fpff = FPFF()
+    for i in range(args.sections):
+        if i % 3 == 0:
+            fpff.append(SectionType.ASCII, f'Section {i}')
+        elif i % 3 == 1:
+            fpff.append(SectionType.DOUBLES, [i, i / 2, i / 3])
+        else:
+            fpff.append(SectionType.COORD, (i / 1000, -i / 1000))
+
+    base_path = tempfile.mkdtemp(dir=args.dir)
+    output_path = os.path.join(base_path, 'exported')
+    try:
+        baseline = bench(fpff, output_path, None)
+        print(f'{"workers":>8}{"seconds":>10}{"speedup":>10}')
+        print(f'{"-":>8}{baseline:>10.3f}{1:>10.2f}')
+        for workers in args.workers:
+            t = bench(fpff, output_path, workers)
+            print(f'{workers:>8}{t:>10.3f}{baseline / t:>10.2f}')
+    finally:
+        shutil.rmtree(base_path)
+
+
+if __name__ == '__main__':
+    main()
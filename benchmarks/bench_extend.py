@@ -0,0 +1,55 @@
+"""Benchmarks adding many sections with FPFF.append and FPFF.extend.
+
+Usage:
+    python -m benchmarks.bench_extend [--sections N]
+"""
+
+import argparse
+import time
+from array import array
+from py_fpff import FPFF, SectionType
+
+
+def bench(mode: str, sections: list) -> float:
+    """Times adding sections to an empty FPFF.
+
+    Args:
+        mode (str): 'append', 'extend', 'trusted' for extend without
+            validation, or 'doubles' for extend_doubles.
+        sections (list): Section types and values to add.
+
+    Returns:
+        float: Seconds taken.
+    """
+
+    fpff = FPFF()
+    start = time.perf_counter()
+    if mode == 'append':
+        for obj_type, obj_data in sections:
+            fpff.append(obj_type, obj_data)
+    elif mode == 'extend':
+        fpff.extend(sections)
+    elif mode == 'trusted':
+        fpff.extend(sections, validate=False)
+    else:
+        fpff.extend_doubles([obj_data for _, obj_data in sections])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, default=500_000)
+    args = parser.parse_args()
+
+    value = array('d', [0.5, 1.5, 2.5])
+    sections = [(SectionType.DOUBLES, value)] * args.sections
+
+    print(f'{args.sections} DOUBLES sections')
+    print(f'{"mode":<10}{"seconds":>10}{"ns/section":>12}')
+    for mode in ['append', 'extend', 'trusted', 'doubles']:
+        t = bench(mode, sections)
+        print(f'{mode:<10}{t:>10.3f}{t / args.sections * 1e9:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Benchmarks FPFF.write on large WORDS and DWORDS sections.
+
+Time per word should stay flat as sections grow if serialization is linear.
+
+Usage:
+    python -m benchmarks.bench_write [--max-words N]
+"""
+
+import argparse
+import os
+import time
+from py_fpff import FPFF, SectionType, Words
+
+
+def bench(stype: SectionType, nwords: int, packed: bool) -> float:
+    """Times writing one section.
+
+    Args:
+        stype (SectionType): WORDS or DWORDS.
+        nwords (int): Number of words in section.
+        packed (bool): Use a Words buffer instead of a list of bytes.
+
+    Returns:
+        float: Seconds taken by FPFF.write.
+    """
+
+    size = 4 if stype == SectionType.WORDS else 8
+    if packed:
+        value = Words(bytes(size * nwords), size)
+    else:
+        word = bytes(size)
+        value = [word] * nwords
+
+    fpff = FPFF()
+    fpff.append(stype, value)
+
+    with open(os.devnull, 'wb') as f:
+        start = time.perf_counter()
+        fpff.write(f)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-words', type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    print(f'{"type":<8}{"value":<8}{"words":>12}{"seconds":>12}{"ns/word":>10}')
+    for stype in [SectionType.WORDS, SectionType.DWORDS]:
+        for packed in [False, True]:
+            nwords = 10_000
+            while nwords <= args.max_words:
+                t = bench(stype, nwords, packed)
+                print(
+                    f'{stype.name:<8}{"Words" if packed else "list":<8}'
+                    f'{nwords:>12}{t:>12.4f}{t / nwords * 1e9:>10.1f}'
+                )
+                nwords *= 10
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,29 @@
 """
 
 import os
+import io
+import json
+import hashlib
+import sys
+import mmap
 import shutil
 import time
 import struct
-from typing import Any, BinaryIO, Union
+import threading
+import asyncio
+from array import array
+from bisect import bisect_left, insort
+from functools import partial
+from typing import Any, AsyncIterator, BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple, Union
+from collections.abc import MutableSequence, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from enum import IntEnum
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class SectionType(IntEnum):
     """Enum types for FPFF section types.
@@ -28,374 +45,3306 @@ class SectionType(IntEnum):
     GIF89 = 10
 
 
-class FPFF:
-    """FPFF file.
+_PNG_SIG = b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A'
+_GIF87_SIG = b'\x47\x49\x46\x38\x37\x61'
+_GIF89_SIG = b'\x47\x49\x46\x38\x39\x61'
+_MEDIA_SIGS = {
+    SectionType.PNG: _PNG_SIG,
+    SectionType.GIF87: _GIF87_SIG,
+    SectionType.GIF89: _GIF89_SIG,
+}
+
+
+class Words(Sequence):
+    """Sequence of fixed-size words backed by a single buffer.
+
+    Words are returned as ``bytes`` so a Words compares equal to a list of the
+    same words, but a section is held in one buffer instead of one object per
+    word.
 
     Attributes:
-        version (int): FPFF version number. Only accepts 1.
-        timestamp (int): UNIX timestamp indicating time of creation.
-        author (str): Author name.
-        nsects (int): Number of sections in the FPFF.
-        stypes (List[SectionType]): List of section types indexed by section.
-        svalues (List[Any]): List of section values indexed by section.
+        size (int): Word size in bytes. 4 for WORDS and 8 for DWORDS.
+
+    Example:
+        >>> words = Words(b'\\x00\\x00\\x00\\x00\\xFF\\xFF\\xFF\\xFF')
+        >>> words[1]
+        b'\\xff\\xff\\xff\\xff'
     """
 
-    def __init__(self, file: Union[BinaryIO, None] = None, author: str = ''):
-        """Initializes new FPFF.
+    __slots__ = ('_view', 'size')
+
+    def __init__(self, buffer: Any = b'', size: int = 4):
+        """Initializes words over buffer.
 
         Args:
-            file (BinaryIO): Optional FPFF input byte stream. Provided if reading FPFF.
-            author (str): Author name. Defaults to ''.
+            buffer (Any): Bytes-like object holding packed words. Not copied.
+            size (int): Word size in bytes. Either 4 or 8. Defaults to 4.
 
-        Example:
-            >>> with open('./input.fpff', 'rb') as f:
-            >>>     fpff = FPFF(f)
+        Raises:
+            ValueError: Word size must be 4 or 8 bytes.
+            ValueError: Buffer length must be a multiple of word size.
         """
 
-        self.version = 1
-        self.timestamp = int(time.time())
-        self.author = author
-        self.nsects = 0
-        self.stypes = list()
-        self.svalues = list()
-
-        # Read FPFF file if supplied
-        if file != None:
-            self.read(file)
+        if size not in (4, 8):
+            raise ValueError("Word size must be 4 or 8 bytes.")
 
-    def read(self, file: BinaryIO):
-        """Reads in FPFF from byte stream.
+        view = memoryview(buffer).cast('B')
+        if len(view) % size != 0:
+            raise ValueError("Buffer length must be a multiple of word size.")
 
-        Args:
-            file (BinaryIO): FPFF input byte stream.
+        self._view = view
+        self.size = size
 
-        Raises:
-            ValueError: Magic did not match FPFF magic.
-            ValueError: Unsupported version. Only version 1 is supported.
-            ValueError: Section length must be greater than 0.
-            ValueError: Improper section length.
-            ValueError: Reference value is out of bounds.
-            ValueError: File contained an unsupported type.
+    def tobytes(self) -> bytes:
+        """Packs words into bytes.
 
-        Example:
-            >>> with open('./input.fpff', 'rb') as f:
-            >>>     fpff = FPFF()
-            >>>     fpff.read(f)
+        Returns:
+            bytes: Concatenated words.
         """
 
-        data = file.read(24)
+        return self._view.tobytes()
+
+    def __getitem__(self, idx):
+        size = self.size
+
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step == 1:
+                return Words(self._view[start*size:max(start, stop)*size], size)
+            return Words(b''.join([self[i] for i in range(start, stop, step)]), size)
 
-        magic = data[0:4][::-1]
-        self.version = int.from_bytes(data[4:8], 'little')
-        self.timestamp = int.from_bytes(data[8:12], 'little')
-        self.author = data[12:20][::-1].decode('ascii').strip('\0')
-        self.nsects = int.from_bytes(data[20:24], 'little')
-        self.stypes = []
-        self.svalues = []
+        n = len(self)
+        if idx < 0:
+            idx += n
+        if idx < 0 or idx >= n:
+            raise IndexError("Words index out of range.")
 
-        # Metadata checks
-        if magic != b'\xBE\xFE\xDA\xDE':
-            raise ValueError("Magic did not match FPFF magic.")
-        if self.version != 1:
-            raise ValueError(
-                "Unsupported version. Only version 1 is supported."
+        return bytes(self._view[idx*size:(idx+1)*size])
+
+    def __iter__(self):
+        view = self._view
+        size = self.size
+        for j in range(0, len(view), size):
+            yield bytes(view[j:j+size])
+
+    def __len__(self) -> int:
+        return len(self._view) // self.size
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Words):
+            return self.size == other.size and self._view == other._view
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other)
             )
+        return NotImplemented
 
-        # Read each section
-        for _ in range(self.nsects):
-            # Read section header and data
-            data = file.read(8)
-            stype = int.from_bytes(data[0:4], 'little')
-            slen = int.from_bytes(data[4:8], 'little')
-
-            if slen <= 0:
-                raise ValueError("Section length must be greater than 0.")
-
-            svalue = file.read(slen)
-
-            # Decode section data
-            if stype == 0x1:
-                # ASCII
-                self.stypes.append(SectionType.ASCII)
-                self.svalues.append(svalue.decode('ascii'))
-            elif stype == 0x2:
-                # UTF-8
-                self.stypes.append(SectionType.UTF8)
-                self.svalues.append(svalue.decode('utf8'))
-            elif stype == 0x3:
-                # Words
-                if slen % 4 != 0:
-                    raise ValueError("Improper section length.")
-                self.stypes.append(SectionType.WORDS)
-                self.svalues.append(
-                    [svalue[j:j+4] for j in range(0, slen, 4)]
-                )
-            elif stype == 0x4:
-                # DWords
-                if slen % 8 != 0:
-                    raise ValueError("Improper section length.")
-                self.stypes.append(SectionType.DWORDS)
-                self.svalues.append(
-                    [svalue[j:j+8] for j in range(0, slen, 8)]
-                )
-            elif stype == 0x5:
-                # Doubles
-                if slen % 8 != 0:
-                    raise ValueError("Improper section length.")
-                self.stypes.append(SectionType.DOUBLES)
-                self.svalues.append(
-                    [struct.unpack("<d", svalue[j:j+8])[0]
-                     for j in range(0, slen, 8)]
-                )
-            elif stype == 0x6:
-                # Coord
-                if slen != 16:
-                    raise ValueError("Improper section length.")
-                self.stypes.append(SectionType.COORD)
-                lat = struct.unpack("<d", svalue[0:8])[0]
-                lng = struct.unpack("<d", svalue[8:16])[0]
-                # TODO: validate lat and lng
-                self.svalues.append((lat, lng))
-            elif stype == 0x7:
-                # Reference
-                if slen != 4:
-                    raise ValueError("Improper section length.")
-                ref = int.from_bytes(svalue[0:4], 'little')
-                if ref < 0 or ref >= self.nsects:
-                    raise ValueError("Reference value is out of bounds.")
-                self.stypes.append(SectionType.REF)
-                self.svalues.append(ref)
-            elif stype == 0x8:
-                # PNG
-                self.stypes.append(SectionType.PNG)
-                sig = b'\x89\x50\x4E\x47\x0D\x0A\x1A\x0A'
-                out = sig + svalue[0:slen]
-                self.svalues.append(out)
-            elif stype == 0x9:
-                # GIF87a
-                self.stypes.append(SectionType.GIF87)
-                sig = b'\x47\x49\x46\x38\x37\x61'
-                out = sig + svalue[0:slen]
-                self.svalues.append(out)
-            elif stype == 0xA:
-                # GIF89a
-                self.stypes.append(SectionType.GIF89)
-                sig = b'\x47\x49\x46\x38\x39\x61'
-                out = sig + svalue[0:slen]
-                self.svalues.append(out)
-            else:
-                raise ValueError("File contained an unsupported type.")
+    def __repr__(self) -> str:
+        return f'Words({self.tobytes()!r}, {self.size})'
 
-    def write(self, file: BinaryIO):
-        """Writes FPFF to byte stream.
+    def __reduce__(self):
+        return (Words, (self.tobytes(), self.size))
 
-        Args:
-            file (BinaryIO): FPFF output byte stream.
 
-        Raises:
-            ValueError: Word needs to be 4 bytes.
-            ValueError: DWord needs to be 8 bytes.
+# FPFF header: magic, version, timestamp, author, number of sections
+_HEADER = struct.Struct('<4sII8sI')
+# Section header: type, length
+_SECTION_HEADER = struct.Struct('<II')
 
-        Example:
-            >>> with open('./output.fpff', 'wb') as out_f:
-            >>>     fpff = FPFF()
-            >>>     fpff.append(SectionType.ASCII, 'Hello, world!')
-            >>>     fpff.write(out_f)
+# Number of items per block of a _BlockList
+_BLOCK_SIZE = 512
+
+# Chunk size for copying section payloads in user space
+_COPY_CHUNK = 1 << 20
+
+# Export manifest holding content digests of section files
+_MANIFEST_NAME = '.fpff-manifest.json'
+
+# Sidecar index: magic, source size, source mtime in ns, number of sections
+_INDEX_HEADER = struct.Struct('<8sQqI')
+# Sidecar index entry: type, payload offset, payload length, payload digest
+_INDEX_ENTRY = struct.Struct('<IQI16s')
+_INDEX_MAGIC = b'FPFFIDX1'
+_INDEX_SUFFIX = '.fpffidx'
+
+# Sequence types accepted as DOUBLES section values
+_DOUBLES_TYPES = [list, array] + ([numpy.ndarray] if numpy != None else [])
+
+# Value types accepted for each section type
+_VALUE_TYPES = {
+    SectionType.ASCII: (str,),
+    SectionType.UTF8: (str,),
+    SectionType.WORDS: (list, Words),
+    SectionType.DWORDS: (list, Words),
+    SectionType.DOUBLES: tuple(_DOUBLES_TYPES),
+    SectionType.COORD: (tuple,),
+    SectionType.REF: (int,),
+    SectionType.PNG: (bytes, bytearray),
+    SectionType.GIF87: (bytes, bytearray),
+    SectionType.GIF89: (bytes, bytearray),
+}
+
+
+def _read_header(file: BinaryIO) -> Tuple[int, int, str, int]:
+    """Reads and validates FPFF header from byte stream.
+
+    Args:
+        file (BinaryIO): FPFF input byte stream positioned at the header.
+
+    Raises:
+        ValueError: Magic did not match FPFF magic.
+        ValueError: Unsupported version. Only version 1 is supported.
+
+    Returns:
+        Tuple[int, int, str, int]: Version, timestamp, author and number of sections.
+    """
+
+    data = file.read(_HEADER.size)
+    if len(data) != _HEADER.size:
+        raise ValueError("Magic did not match FPFF magic.")
+
+    magic, version, timestamp, author, nsects = _HEADER.unpack(data)
+    magic = magic[::-1]
+    author = author[::-1].decode('ascii').strip('\0')
+
+    # Metadata checks
+    if magic != b'\xBE\xFE\xDA\xDE':
+        raise ValueError("Magic did not match FPFF magic.")
+    if version != 1:
+        raise ValueError(
+            "Unsupported version. Only version 1 is supported."
+        )
+
+    return version, timestamp, author, nsects
+
+
+def _check_section(stype: int, slen: int) -> SectionType:
+    """Validates section header.
+
+    Args:
+        stype (int): Raw section type.
+        slen (int): Section length in bytes.
+
+    Raises:
+        ValueError: Section length must be greater than 0.
+        ValueError: Improper section length.
+        ValueError: File contained an unsupported type.
+
+    Returns:
+        SectionType: Section type.
+    """
+
+    if slen <= 0:
+        raise ValueError("Section length must be greater than 0.")
+
+    if stype == SectionType.WORDS and slen % 4 != 0:
+        raise ValueError("Improper section length.")
+    if stype in (SectionType.DWORDS, SectionType.DOUBLES) and slen % 8 != 0:
+        raise ValueError("Improper section length.")
+    if stype == SectionType.COORD and slen != 16:
+        raise ValueError("Improper section length.")
+    if stype == SectionType.REF and slen != 4:
+        raise ValueError("Improper section length.")
+
+    try:
+        return SectionType(stype)
+    except ValueError:
+        raise ValueError("File contained an unsupported type.") from None
+
+
+def _unpack_doubles(svalue: Any, as_array: bool = False) -> Any:
+    """Decodes little-endian doubles in bulk.
+
+    Args:
+        svalue (Any): Packed doubles as a bytes-like object.
+        as_array (bool): Return an array instead of a list. Defaults to False.
+
+    Returns:
+        Any: List of floats. If ``as_array``, a read-only NumPy array when NumPy
+            is installed and an ``array('d')`` otherwise.
+    """
+
+    if as_array and numpy != None:
+        return numpy.frombuffer(svalue, dtype='<f8')
+
+    values = array('d')
+    values.frombytes(svalue)
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    return values if as_array else values.tolist()
+
+
+def _pack_doubles(values: Any) -> memoryview:
+    """Encodes doubles in bulk as little-endian.
+
+    Args:
+        values (Any): List of numbers, ``array('d')`` or NumPy array.
+
+    Returns:
+        memoryview: Packed doubles.
+    """
+
+    if numpy != None and isinstance(values, numpy.ndarray):
+        values = numpy.ascontiguousarray(values, dtype='<f8')
+        return memoryview(values.view(numpy.uint8))
+
+    if type(values) != array or values.typecode != 'd' or sys.byteorder == 'big':
+        values = array('d', values)
+        if sys.byteorder == 'big':
+            values.byteswap()
+
+    return memoryview(values).cast('B')
+
+
+def _decode_section(stype: SectionType, svalue: Any, nsects: int,
+                    as_array: bool = False) -> Any:
+    """Decodes section payload.
+
+    Args:
+        stype (SectionType): Section type. Must already be checked against the payload length.
+        svalue (Any): Section payload as a bytes-like object.
+        nsects (int): Number of sections in the FPFF. Used to bounds check references.
+        as_array (bool): Decode doubles to an array instead of a list. Defaults to False.
+
+    Raises:
+        ValueError: Reference value is out of bounds.
+
+    Returns:
+        Any: Section value.
+    """
+
+    if stype == SectionType.ASCII:
+        return str(svalue, 'ascii')
+    elif stype == SectionType.UTF8:
+        return str(svalue, 'utf8')
+    elif stype == SectionType.WORDS:
+        return Words(svalue, 4)
+    elif stype == SectionType.DWORDS:
+        return Words(svalue, 8)
+    elif stype == SectionType.DOUBLES:
+        return _unpack_doubles(svalue, as_array)
+    elif stype == SectionType.COORD:
+        lat = struct.unpack("<d", svalue[0:8])[0]
+        lng = struct.unpack("<d", svalue[8:16])[0]
+        # TODO: validate lat and lng
+        return (lat, lng)
+    elif stype == SectionType.REF:
+        ref = int.from_bytes(svalue[0:4], 'little')
+        if ref < 0 or ref >= nsects:
+            raise ValueError("Reference value is out of bounds.")
+        return ref
+    elif stype == SectionType.PNG:
+        return _PNG_SIG + svalue
+    elif stype == SectionType.GIF87:
+        return _GIF87_SIG + svalue
+    elif stype == SectionType.GIF89:
+        return _GIF89_SIG + svalue
+
+
+def _check_value(obj_type: SectionType, obj_data: Any):
+    """Checks section value is valid for section type.
+
+    Args:
+        obj_type (SectionType): Section type.
+        obj_data (Any): Section value.
+
+    Raises:
+        TypeError: Object data not valid for object type.
+    """
+
+    if type(obj_data) not in _VALUE_TYPES.get(obj_type, ()):
+        raise TypeError("Object data not valid for object type.")
+
+
+def _encode_section(stype: SectionType, svalue: Any) -> Any:
+    """Encodes section value to payload.
+
+    Args:
+        stype (SectionType): Section type.
+        svalue (Any): Section value.
+
+    Raises:
+        ValueError: Word needs to be 4 bytes.
+        ValueError: DWord needs to be 8 bytes.
+
+    Returns:
+        Any: Section payload as a bytes-like object.
+    """
+
+    section_bytes = b''
+
+    if stype == SectionType.ASCII:
+        # ASCII
+        section_bytes = svalue.encode('ascii')
+    elif stype == SectionType.UTF8:
+        # UTF-8
+        section_bytes = svalue.encode('utf8')
+    elif stype == SectionType.WORDS and type(svalue) == Words:
+        # Words buffer
+        if svalue.size != 4:
+            raise ValueError("Word needs to be 4 bytes.")
+        section_bytes = svalue._view
+    elif stype == SectionType.DWORDS and type(svalue) == Words:
+        # DWords buffer
+        if svalue.size != 8:
+            raise ValueError("DWord needs to be 8 bytes.")
+        section_bytes = svalue._view
+    elif stype == SectionType.WORDS:
+        # Words
+        if set(map(len, svalue)) - {4}:
+            raise ValueError("Word needs to be 4 bytes.")
+        section_bytes = b''.join(svalue)
+    elif stype == SectionType.DWORDS:
+        # DWords
+        if set(map(len, svalue)) - {8}:
+            raise ValueError("DWord needs to be 8 bytes.")
+        section_bytes = b''.join(svalue)
+    elif stype == SectionType.DOUBLES:
+        # Doubles
+        section_bytes = _pack_doubles(svalue)
+    elif stype == SectionType.COORD:
+        # Coords
+        section_bytes = struct.pack("<d", svalue[0])
+        section_bytes += struct.pack("<d", svalue[1])
+    elif stype == SectionType.REF:
+        # Reference
+        section_bytes = svalue.to_bytes(4, 'little')
+    elif stype == SectionType.PNG:
+        # PNG
+        section_bytes = memoryview(svalue)[len(_PNG_SIG):]
+    elif stype == SectionType.GIF87:
+        # GIF87a
+        section_bytes = memoryview(svalue)[len(_GIF87_SIG):]
+    elif stype == SectionType.GIF89:
+        # GIF89a
+        section_bytes = memoryview(svalue)[len(_GIF89_SIG):]
+
+    return section_bytes
+
+
+def _write_header(file: BinaryIO, version: int, timestamp: int, author: str, nsects: int):
+    """Writes FPFF header to byte stream.
+
+    Args:
+        file (BinaryIO): FPFF output byte stream.
+        version (int): FPFF version number.
+        timestamp (int): UNIX timestamp indicating time of creation.
+        author (str): Author name.
+        nsects (int): Number of sections.
+
+    Raises:
+        ValueError: Author must be at most 8 bytes.
+    """
+
+    author_bytes = author.encode('ascii')[::-1]
+    if len(author_bytes) > 8:
+        raise ValueError("Author must be at most 8 bytes.")
+
+    file.write(b'\xDE\xDA\xFE\xBE')
+    file.write(version.to_bytes(4, 'little'))
+    file.write(timestamp.to_bytes(4, 'little'))
+    file.write(author_bytes)
+    file.write(b'\x00'*(8-len(author_bytes)))
+    file.write(nsects.to_bytes(4, 'little'))
+
+
+def _write_section(file: BinaryIO, stype: SectionType, section_bytes: Any):
+    """Writes section header and payload to byte stream.
+
+    Args:
+        file (BinaryIO): FPFF output byte stream.
+        stype (SectionType): Section type.
+        section_bytes (Any): Section payload as a bytes-like object.
+    """
+
+    section_bytes = memoryview(section_bytes).cast('B')
+    file.write(stype.to_bytes(4, 'little'))
+    file.write(len(section_bytes).to_bytes(4, 'little'))
+    file.write(section_bytes)
+
+
+class _Source:
+    """Random access reader over an FPFF input byte stream.
+
+    Reads are served from a read-only memory map when one is requested, in
+    which case payloads are returned as zero-copy memoryview slices.
+    """
+
+    def __init__(self, file: BinaryIO, use_mmap: bool = False, owned: bool = False,
+                 nsects: int = 0, as_array: bool = False):
+        """Initializes source.
+
+        Args:
+            file (BinaryIO): Seekable FPFF input byte stream.
+            use_mmap (bool): Memory map the stream. Stream must be backed by a file. Defaults to False.
+            owned (bool): Close the stream along with the source. Defaults to False.
+            nsects (int): Number of sections in the source FPFF. Defaults to 0.
+            as_array (bool): Decode doubles to arrays instead of lists. Defaults to False.
         """
 
-        # Write FPFF header
-        file.write(b'\xDE\xDA\xFE\xBE')
-        file.write(self.version.to_bytes(4, 'little'))
-        file.write(self.timestamp.to_bytes(4, 'little'))
-        author_bytes = self.author.encode('ascii')[::-1]
-        file.write(author_bytes)
-        file.write(b'\x00'*(8-len(author_bytes)))
-        file.write(self.nsects.to_bytes(4, 'little'))
+        self.file = file
+        self.owned = owned
+        self.nsects = nsects
+        self.as_array = as_array
+        self.closed = False
+        self.mmap = None
+        self.view = None
+        self.lock = threading.Lock()
 
-        # Write each section
-        for i in range(self.nsects):
-            section_bytes = b''
-
-            if self.stypes[i] == SectionType.ASCII:
-                # ASCII
-                section_bytes = self.svalues[i].encode('ascii')
-            elif self.stypes[i] == SectionType.UTF8:
-                # UTF-8
-                section_bytes = self.svalues[i].encode('utf8')
-            elif self.stypes[i] == SectionType.WORDS:
-                # Words
-                for w in self.svalues[i]:
-                    if len(w) != 4:
-                        raise ValueError("Word needs to be 4 bytes.")
-                    section_bytes += w
-            elif self.stypes[i] == SectionType.DWORDS:
-                # DWords
-                for w in self.svalues[i]:
-                    if len(w) != 8:
-                        raise ValueError("DWord needs to be 8 bytes.")
-                    section_bytes += w
-            elif self.stypes[i] == SectionType.DOUBLES:
-                # Doubles
-                section_bytes = b''.join(
-                    [struct.pack("<d", w) for w in self.svalues[i]]
-                )
-            elif self.stypes[i] == SectionType.COORD:
-                # Coords
-                section_bytes = struct.pack("<d", self.svalues[i][0])
-                section_bytes += struct.pack("<d", self.svalues[i][1])
-            elif self.stypes[i] == SectionType.REF:
-                # Reference
-                section_bytes = self.svalues[i].to_bytes(4, 'little')
-            elif self.stypes[i] == SectionType.PNG:
-                # PNG
-                section_bytes = self.svalues[i][8:]
-            elif self.stypes[i] == SectionType.GIF87:
-                # GIF87a
-                section_bytes = self.svalues[i][6:]
-            elif self.stypes[i] == SectionType.GIF89:
-                # GIF89a
-                section_bytes = self.svalues[i][6:]
-
-            # Write to file
-            file.write(self.stypes[i].to_bytes(4, 'little'))
-            file.write(len(section_bytes).to_bytes(4, 'little'))
-            file.write(section_bytes)
-
-    def export(self, output_path: str):
-        """Exports FPFF sections to directory.
+        if use_mmap:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mmap)
+            self.size = len(self.mmap)
+        else:
+            pos = file.tell()
+            self.size = file.seek(0, os.SEEK_END)
+            file.seek(pos)
+
+    def read(self, offset: int, length: int) -> Any:
+        """Reads bytes from source.
 
         Args:
-            output_path (str): Path to export directory.
+            offset (int): Absolute offset in source.
+            length (int): Number of bytes to read.
 
-        Example:
-            >>> with open('./input.fpff') as f:
-            >>>     fpff = FPFF(f)
-            >>>     fpff.export('./exported')
+        Returns:
+            Any: Bytes, or a memoryview slice if memory mapped.
         """
 
-        # Ensure output path exists
-        if os.path.exists(output_path):
-            shutil.rmtree(output_path)
-        os.mkdir(output_path)
+        if self.view != None:
+            return self.view[offset:offset+length]
 
-        # Export files
-        for i in range(self.nsects):
-            if self.stypes[i] not in [SectionType.PNG, SectionType.GIF87, SectionType.GIF89]:
-                # Non-media section
-                file_name = f'section-{i}.txt'
-                output = ''
-                if self.stypes[i] == SectionType.ASCII:
-                    output = self.svalues[i]
-                elif self.stypes[i] == SectionType.UTF8:
-                    output = self.svalues[i]
-                elif self.stypes[i] == SectionType.WORDS:
-                    output = ', '.join(
-                        [val.hex() for val in self.svalues[i]]
-                    )
-                elif self.stypes[i] == SectionType.DWORDS:
-                    output = ', '.join(
-                        [val.hex() for val in self.svalues[i]]
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+    def close(self):
+        """Closes memory map and owned stream.
+        """
+
+        self.closed = True
+        if self.mmap != None:
+            self.view.release()
+            try:
+                self.mmap.close()
+            except BufferError:
+                # Payload views are still in use. Mapping is released
+                # once the last view is garbage collected.
+                pass
+            self.mmap = None
+            self.view = None
+        if self.owned:
+            self.file.close()
+
+
+def _iter_payloads(file: BinaryIO, nsects: int) -> Iterator[Tuple[SectionType, bytes]]:
+    """Reads sections one at a time from byte stream.
+
+    Args:
+        file (BinaryIO): FPFF input byte stream positioned after the header.
+        nsects (int): Number of sections to read.
+
+    Raises:
+        ValueError: Section length must be greater than 0.
+        ValueError: Improper section length.
+        ValueError: File contained an unsupported type.
+        ValueError: Section extends past end of file.
+
+    Yields:
+        Tuple[SectionType, bytes]: Section type and payload.
+    """
+
+    for _ in range(nsects):
+        # Read section header and data
+        data = file.read(8)
+        if len(data) != 8:
+            raise ValueError("Section extends past end of file.")
+        stype = int.from_bytes(data[0:4], 'little')
+        slen = int.from_bytes(data[4:8], 'little')
+        stype = _check_section(stype, slen)
+
+        svalue = file.read(slen)
+        if len(svalue) != slen:
+            raise ValueError("Section extends past end of file.")
+
+        yield stype, svalue
+
+
+async def _aread_header(reader: asyncio.StreamReader) -> Tuple[int, int, str, int]:
+    """Reads and validates FPFF header from asyncio stream.
+
+    Args:
+        reader (asyncio.StreamReader): FPFF input stream positioned at the header.
+
+    Raises:
+        ValueError: Magic did not match FPFF magic.
+        ValueError: Unsupported version. Only version 1 is supported.
+
+    Returns:
+        Tuple[int, int, str, int]: Version, timestamp, author and number of sections.
+    """
+
+    try:
+        data = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError:
+        raise ValueError("Magic did not match FPFF magic.")
+
+    return _read_header(io.BytesIO(data))
+
+
+async def _aiter_payloads(reader: asyncio.StreamReader,
+                          nsects: int) -> AsyncIterator[Tuple[SectionType, bytes]]:
+    """Reads sections one at a time from asyncio stream.
+
+    Args:
+        reader (asyncio.StreamReader): FPFF input stream positioned after the header.
+        nsects (int): Number of sections to read.
+
+    Raises:
+        ValueError: Section length must be greater than 0.
+        ValueError: Improper section length.
+        ValueError: File contained an unsupported type.
+        ValueError: Section extends past end of file.
+
+    Yields:
+        Tuple[SectionType, bytes]: Section type and payload.
+    """
+
+    for _ in range(nsects):
+        try:
+            stype, slen = _SECTION_HEADER.unpack(await reader.readexactly(8))
+            stype = _check_section(stype, slen)
+            svalue = await reader.readexactly(slen)
+        except asyncio.IncompleteReadError:
+            raise ValueError("Section extends past end of file.")
+
+        yield stype, svalue
+
+
+def _iter_range(source: _Source, offset: int, length: int) -> Iterator[Any]:
+    """Reads range of source in chunks.
+
+    Args:
+        source (_Source): FPFF source.
+        offset (int): Absolute offset in source.
+        length (int): Number of bytes to read.
+
+    Yields:
+        Any: Chunks of at most ``_COPY_CHUNK`` bytes.
+    """
+
+    end = offset + length
+    while offset < end:
+        chunk = source.read(offset, min(end - offset, _COPY_CHUNK))
+        if len(chunk) == 0:
+            raise ValueError("Section extends past end of file.")
+        yield chunk
+        offset += len(chunk)
+
+
+def _copy_range(source: _Source, offset: int, length: int, file: BinaryIO):
+    """Copies range of source to the end of an output stream.
+
+    The copy is done in the kernel with ``os.copy_file_range`` or
+    ``os.sendfile`` when both ends are files and the output is seekable,
+    and falls back to copying through user space in chunks otherwise, such
+    as for pipes and sockets.
+
+    Args:
+        source (_Source): FPFF source.
+        offset (int): Absolute offset in source.
+        length (int): Number of bytes to copy.
+        file (BinaryIO): Output byte stream.
+    """
+
+    try:
+        src_fd = source.file.fileno()
+        dst_fd = file.fileno()
+        if not file.seekable():
+            src_fd = dst_fd = None
+    except (AttributeError, OSError):
+        src_fd = dst_fd = None
+
+    if src_fd != None:
+        file.flush()
+        dst_offset = file.tell()
+        copied = 0
+        try:
+            if hasattr(os, 'copy_file_range'):
+                while copied < length:
+                    n = os.copy_file_range(
+                        src_fd, dst_fd, length - copied,
+                        offset + copied, dst_offset + copied
                     )
-                elif self.stypes[i] == SectionType.DOUBLES:
-                    output = ', '.join(
-                        [str(val) for val in self.svalues[i]]
+                    if n == 0:
+                        break
+                    copied += n
+            elif hasattr(os, 'sendfile'):
+                os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+                while copied < length:
+                    n = os.sendfile(
+                        dst_fd, src_fd, offset + copied, length - copied
                     )
-                elif self.stypes[i] == SectionType.COORD:
-                    output = f'LAT: {str(self.svalues[i][0])}\nLNG: {str(self.svalues[i][1])}'
-                elif self.stypes[i] == SectionType.REF:
-                    output = f'REF: {str(self.svalues[i])}'
+                    if n == 0:
+                        break
+                    copied += n
+        except OSError:
+            # Not supported between these files. Copy the rest in user space.
+            pass
+        file.seek(dst_offset + copied)
+        offset += copied
+        length -= copied
 
-                with open(os.path.join(output_path, file_name), 'w', encoding='utf8') as f:
-                    f.write(output)
+    for chunk in _iter_range(source, offset, length):
+        file.write(chunk)
 
-            else:
-                # Media section
-                if self.stypes[i] == SectionType.PNG:
-                    file_name = f'section-{i}.png'
-                    with open(os.path.join(output_path, file_name), 'wb') as f:
-                        f.write(self.svalues[i])
-                elif self.stypes[i] == SectionType.GIF87:
-                    file_name = f'section-{i}.gif'
-                    with open(os.path.join(output_path, file_name), 'wb') as f:
-                        f.write(self.svalues[i])
-                elif self.stypes[i] == SectionType.GIF89:
-                    file_name = f'section-{i}.gif'
-                    with open(os.path.join(output_path, file_name), 'wb') as f:
-                        f.write(self.svalues[i])
 
-    def insert(self, section_idx: int, obj_type: SectionType, obj_data: Any):
-        """Inserts section before indicated index.
+def _scan_sections(source: _Source, offset: int, nsects: int) -> List['Section']:
+    """Scans section headers without reading section payloads.
 
-        Args:
-            section_idx (int): Section index to insert in front of.
-            obj_type (int): Section type of new section.
-            obj_data (Any): Section value of new section.
+    Args:
+        source (_Source): FPFF source.
+        offset (int): Offset of the first section header.
+        nsects (int): Number of sections to scan.
 
-        Raises:
-            TypeError: Object data not valid for object type.
+    Raises:
+        ValueError: Section extends past end of file.
 
-        Example:
-            >>> fpff.insert(0, SectionType.ASCII, 'Hello, world!')
-        """
+    Returns:
+        List[Section]: Undecoded section located in source for each section.
+    """
 
-        if obj_type == SectionType.ASCII and type(obj_data) == str:
-            self.svalues.insert(section_idx, obj_data)
-        elif obj_type == SectionType.UTF8 and type(obj_data) == str:
-            self.svalues.insert(section_idx, obj_data)
-        elif obj_type == SectionType.WORDS and type(obj_data) == list:
-            self.svalues.insert(section_idx, obj_data)
-        elif obj_type == SectionType.DWORDS and type(obj_data) == list:
-            self.svalues.insert(section_idx, obj_data)
-        elif obj_type == SectionType.DOUBLES and type(obj_data) == list:
-            self.svalues.insert(section_idx, obj_data)
-        elif obj_type == SectionType.COORD and type(obj_data) == tuple:
-            self.svalues.insert(section_idx, obj_data)
-        elif obj_type == SectionType.REF and type(obj_data) == int:
-            self.svalues.insert(section_idx, obj_data)
-        elif obj_type == SectionType.PNG and type(obj_data) in [bytes, bytearray]:
-            self.svalues.insert(section_idx, obj_data)
-        elif obj_type == SectionType.GIF87 and type(obj_data) in [bytes, bytearray]:
-            self.svalues.insert(section_idx, obj_data)
-        elif obj_type == SectionType.GIF89 and type(obj_data) in [bytes, bytearray]:
-            self.svalues.insert(section_idx, obj_data)
-        else:
-            raise TypeError("Object data not valid for object type.")
+    return list(_walk_sections(source, offset, nsects))
 
-        self.stypes.insert(section_idx, obj_type)
-        self.nsects += 1
 
-    def append(self, obj_type: SectionType, obj_data: Any):
-        """Appends section.
+def _walk_sections(source: _Source, offset: int, nsects: int) -> Iterator['Section']:
+    """Scans section headers one at a time without reading section payloads.
 
-        Args:
-            obj_type (int): Section type of new section.
-            obj_data (Any): Section value of new section.
+    Args:
+        source (_Source): FPFF source.
+        offset (int): Offset of the first section header.
+        nsects (int): Number of sections to scan.
 
-        Example:
-            >>> fpff.append(SectionType.ASCII, 'Hello, world!')
-        """
+    Raises:
+        ValueError: Section extends past end of file.
 
-        self.insert(self.nsects, obj_type, obj_data)
+    Yields:
+        Section: Undecoded section located in source.
+    """
 
-    def remove(self, section_idx: int):
-        """Removes section at index.
+    for _ in range(nsects):
+        data = source.read(offset, 8)
+        if len(data) != 8:
+            raise ValueError("Section extends past end of file.")
+        stype, slen = _SECTION_HEADER.unpack(data)
+        stype = _check_section(stype, slen)
 
-        Args:
-            section_idx (int): Index of section to remove.
+        offset += 8
+        if offset + slen > source.size:
+            raise ValueError("Section extends past end of file.")
+        yield Section._from_source(stype, offset, slen, source)
+        offset += slen
 
-        Example:
-            >>> fpff.remove(0)
+
+class _BlockList(MutableSequence):
+    """List split into blocks for fast positional insert and delete.
+
+    Blocks hold up to ``2 * _BLOCK_SIZE`` items. A Fenwick tree over block
+    lengths finds the block holding a position in O(log n), so inserting or
+    deleting only shifts items within one block instead of the whole list.
+    The tree is rebuilt when blocks are split or dropped, which happens at
+    most once every ``_BLOCK_SIZE`` edits.
+    """
+
+    def __init__(self, items: Iterable[Any] = ()):
+        """Initializes block list.
+
+        Args:
+            items (Iterable[Any]): Initial items. Defaults to empty.
         """
 
-        del self.svalues[section_idx]
-        del self.stypes[section_idx]
-        self.nsects -= 1
+        self._rebuild(list(items))
 
-    def __repr__(self) -> str:
-        """String representation of FPFF.
+    def _rebuild(self, items: List[Any]):
+        self._blocks = [
+            items[j:j+_BLOCK_SIZE] for j in range(0, len(items), _BLOCK_SIZE)
+        ]
+        self._len = len(items)
+        self._build_tree()
+
+    def _build_tree(self):
+        nblocks = len(self._blocks)
+        tree = [0] * (nblocks + 1)
+        for b, block in enumerate(self._blocks, 1):
+            tree[b] += len(block)
+            parent = b + (b & -b)
+            if parent <= nblocks:
+                tree[parent] += tree[b]
+        self._tree = tree
+        self._top = 1 << (nblocks.bit_length() - 1) if nblocks else 0
+
+    def _update_tree(self, b: int, delta: int):
+        tree = self._tree
+        b += 1
+        while b < len(tree):
+            tree[b] += delta
+            b += b & -b
+
+    def _locate(self, idx: int) -> Tuple[int, int]:
+        """Finds block and offset within block of a position.
+
+        Args:
+            idx (int): Position. Negative positions count from the end.
+
+        Raises:
+            IndexError: List index out of range.
 
         Returns:
-            string: String representation of FPFF.
+            Tuple[int, int]: Block number and offset within block.
         """
 
-        return str(self.stypes)
+        if idx < 0:
+            idx += self._len
+        if idx < 0 or idx >= self._len:
+            raise IndexError("List index out of range.")
+
+        tree = self._tree
+        b = 0
+        bit = self._top
+        while bit:
+            nxt = b + bit
+            if nxt < len(tree) and tree[nxt] <= idx:
+                b = nxt
+                idx -= tree[nxt]
+            bit >>= 1
+
+        return b, idx
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return list(self)[idx]
+        b, o = self._locate(idx)
+        return self._blocks[b][o]
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            items = list(self)
+            items[idx] = value
+            self._rebuild(items)
+            return
+        b, o = self._locate(idx)
+        self._blocks[b][o] = value
+
+    def __delitem__(self, idx):
+        if isinstance(idx, slice):
+            items = list(self)
+            del items[idx]
+            self._rebuild(items)
+            return
+
+        b, o = self._locate(idx)
+        block = self._blocks[b]
+        del block[o]
+        self._len -= 1
+        if block:
+            self._update_tree(b, -1)
+        else:
+            del self._blocks[b]
+            self._build_tree()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def insert(self, idx: int, value: Any):
+        # Clamp like list.insert
+        if idx < 0:
+            idx = max(idx + self._len, 0)
+        if idx >= self._len:
+            if not self._blocks:
+                self._blocks.append([])
+                self._build_tree()
+            b = len(self._blocks) - 1
+            o = len(self._blocks[b])
+        else:
+            b, o = self._locate(idx)
+
+        block = self._blocks[b]
+        block.insert(o, value)
+        self._len += 1
+        if len(block) > 2 * _BLOCK_SIZE:
+            self._blocks[b:b+1] = [block[:_BLOCK_SIZE], block[_BLOCK_SIZE:]]
+            self._build_tree()
+        else:
+            self._update_tree(b, 1)
+
+    def extend(self, values: Iterable[Any]):
+        self.splice(self._len, self._len, values)
+
+    def splice(self, start: int, stop: int, values: Iterable[Any] = ()):
+        """Replaces items in range with values in one step.
+
+        Only the blocks holding the ends of the range are rebuilt, so the
+        cost is proportional to the number of items removed and added plus
+        the number of blocks.
+
+        Args:
+            start (int): First position to replace. Clamped to the list.
+            stop (int): Position after the last to replace. Clamped to the list.
+            values (Iterable[Any]): Items to put in place of the range. Defaults to empty.
+        """
+
+        start = min(max(start, 0), self._len)
+        stop = min(max(stop, start), self._len)
+        values = list(values)
+
+        if start < self._len:
+            b1, o1 = self._locate(start)
+        else:
+            b1, o1 = len(self._blocks), 0
+        if stop < self._len:
+            b2, o2 = self._locate(stop)
+        else:
+            b2, o2 = len(self._blocks), 0
+
+        # Merge the partial blocks at both ends with the new values
+        middle = []
+        if b1 < len(self._blocks):
+            middle.extend(self._blocks[b1][:o1])
+        elif b1 > 0 and len(self._blocks[b1 - 1]) < _BLOCK_SIZE:
+            # Top up the last block instead of starting a new one
+            b1 -= 1
+            middle.extend(self._blocks[b1])
+        middle.extend(values)
+        if b2 < len(self._blocks):
+            middle.extend(self._blocks[b2][o2:])
+
+        self._blocks[b1:b2+1] = [
+            middle[j:j+_BLOCK_SIZE] for j in range(0, len(middle), _BLOCK_SIZE)
+        ]
+        self._len += len(values) - (stop - start)
+        self._build_tree()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, _BlockList)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+# Marks a source section that has not been decoded yet
+_UNDECODED = object()
+
+# Decoded value types that cannot be changed in place. Sections holding
+# these keep their source payload once decoded.
+_IMMUTABLE_TYPES = (str, bytes, tuple, int, Words)
+
+
+class Section:
+    """FPFF section.
+
+    Sections of an FPFF from :meth:`FPFF.open` are decoded on first access
+    to their value. They keep their place in the source for as long as they
+    are known to be unmodified, so they can be written back from their
+    original payload. Sections count as modified once their type or value
+    is replaced, or once decoded to a value that can be changed in place,
+    such as a list.
+
+    Attributes:
+        stype (SectionType): Section type.
+        value (Any): Section value.
+        offset (int): Offset of section payload in source, or None if modified
+            or not read from a source.
+        length (int): Length of section payload in source, or None if modified
+            or not read from a source.
+    """
+
+    __slots__ = ('_stype', '_value', 'offset', 'length', '_source')
+
+    def __init__(self, stype: SectionType, value: Any):
+        """Initializes section.
+
+        Args:
+            stype (SectionType): Section type.
+            value (Any): Section value.
+
+        Example:
+            >>> section = Section(SectionType.ASCII, 'Hello, world!')
+        """
+
+        self._stype = stype
+        self._value = value
+        self.offset = None
+        self.length = None
+        self._source = None
+
+    @classmethod
+    def _from_source(cls, stype: SectionType, offset: int, length: int,
+                     source: Union[_Source, None] = None) -> 'Section':
+        """Creates undecoded section located in source.
+
+        Args:
+            stype (SectionType): Section type.
+            offset (int): Offset of section payload in source.
+            length (int): Length of section payload.
+            source (_Source): FPFF source. Defaults to None.
+
+        Returns:
+            Section: Section decoded on first access.
+        """
+
+        section = cls(stype, _UNDECODED)
+        section.offset = offset
+        section.length = length
+        section._source = source
+        return section
+
+    @property
+    def stype(self) -> SectionType:
+        return self._stype
+
+    @stype.setter
+    def stype(self, stype: SectionType):
+        if self._value is _UNDECODED:
+            # Decode with the original type before leaving the source
+            self._value = self._decode()
+        self._stype = stype
+        self._detach()
+
+    @property
+    def value(self) -> Any:
+        if self._value is _UNDECODED:
+            self._value = self._decode()
+            if type(self._value) not in _IMMUTABLE_TYPES:
+                # Value may be changed in place, so it can no longer be
+                # written from the source payload
+                self._detach()
+        return self._value
+
+    @value.setter
+    def value(self, value: Any):
+        self._value = value
+        self._detach()
+
+    @property
+    def modified(self) -> bool:
+        """bool: Whether the section may differ from a source payload."""
+
+        return self.offset == None
+
+    def _decode(self) -> Any:
+        source = self._source
+        return _decode_section(
+            self._stype, source.read(self.offset, self.length),
+            source.nsects, source.as_array
+        )
+
+    def _detach(self):
+        self.offset = None
+        self.length = None
+        self._source = None
+
+    def _located(self) -> bool:
+        """Checks whether the payload can be read from an open source.
+
+        Returns:
+            bool: True if unmodified and the source is still open.
+        """
+
+        return self.offset != None and not self._source.closed
+
+    def raw(self) -> memoryview:
+        """Gets raw payload of section.
+
+        Raises:
+            ValueError: Word needs to be 4 bytes.
+            ValueError: DWord needs to be 8 bytes.
+
+        Returns:
+            memoryview: Section payload, without media signature.
+        """
+
+        if self._located():
+            return memoryview(self._source.read(self.offset, self.length))
+        return memoryview(_encode_section(self._stype, self.value))
+
+    def __repr__(self) -> str:
+        return f'Section({self._stype!r}, {self.value!r})'
+
+
+class _SectionView(MutableSequence):
+    """Sequence of one attribute of each section of an FPFF.
+
+    Items can be replaced through the view, but sections can only be
+    added or removed through the FPFF.
+    """
+
+    __slots__ = ('_fpff', '_attr')
+
+    def __init__(self, fpff: 'FPFF', attr: str):
+        """Initializes view.
+
+        Args:
+            fpff (FPFF): FPFF to view.
+            attr (str): Section attribute to view.
+        """
+
+        self._fpff = fpff
+        self._attr = attr
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [getattr(section, self._attr) for section in self._fpff.sections[idx]]
+        return getattr(self._fpff.sections[idx], self._attr)
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            indices = range(*idx.indices(len(self)))
+            value = list(value)
+            if len(value) != len(indices):
+                raise ValueError("Section views cannot be resized.")
+            for i, v in zip(indices, value):
+                self._fpff._set(i, self._attr, v)
+        else:
+            self._fpff._set(idx, self._attr, value)
+
+    def __delitem__(self, idx):
+        raise TypeError("Section views cannot be resized.")
+
+    def insert(self, idx: int, value: Any):
+        raise TypeError("Section views cannot be resized.")
+
+    def __len__(self) -> int:
+        return len(self._fpff.sections)
+
+    def __iter__(self):
+        for section in self._fpff.sections:
+            yield getattr(section, self._attr)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, _BlockList, _SectionView)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class _RefIndex:
+    """Index from each referenced section to the REF sections referencing it.
+
+    Positions of REF sections and of their targets are also kept in sorted
+    lists, so shifting positions after an edit only touches references at
+    or past the edit.
+    """
+
+    def __init__(self, sections: Iterable[Section]):
+        """Builds index by decoding every REF section.
+
+        Args:
+            sections (Iterable[Section]): Sections of the FPFF.
+        """
+
+        self._targets = {}
+        self._referrers = {}
+        for i, section in enumerate(sections):
+            if section.stype == SectionType.REF and type(section.value) == int:
+                self._targets[i] = section.value
+                self._referrers.setdefault(section.value, set()).add(i)
+
+        self._ref_keys = list(self._targets)
+        self._target_keys = sorted(self._referrers)
+
+    def add(self, referrer: int, target: Any):
+        """Adds reference.
+
+        Args:
+            referrer (int): Position of REF section.
+            target (Any): Section value. Ignored unless an int.
+        """
+
+        if type(target) != int:
+            return
+
+        self._targets[referrer] = target
+        insort(self._ref_keys, referrer)
+        if target not in self._referrers:
+            self._referrers[target] = set()
+            insort(self._target_keys, target)
+        self._referrers[target].add(referrer)
+
+    def discard(self, referrer: int):
+        """Removes reference if there is one.
+
+        Args:
+            referrer (int): Position of REF section.
+        """
+
+        target = self._targets.pop(referrer, None)
+        if target == None:
+            return
+
+        del self._ref_keys[bisect_left(self._ref_keys, referrer)]
+        referrers = self._referrers[target]
+        referrers.discard(referrer)
+        if not referrers:
+            del self._referrers[target]
+            del self._target_keys[bisect_left(self._target_keys, target)]
+
+    def referrers(self, target: int) -> Iterable[int]:
+        """Gets positions of REF sections referencing a section.
+
+        Args:
+            target (int): Position of referenced section.
+
+        Returns:
+            Iterable[int]: Positions of REF sections.
+        """
+
+        return self._referrers.get(target, ())
+
+    def targets(self, start: int, stop: int) -> List[int]:
+        """Gets referenced positions in range.
+
+        Args:
+            start (int): First position.
+            stop (int): Position after the last.
+
+        Returns:
+            List[int]: Referenced positions in order.
+        """
+
+        return self._target_keys[
+            bisect_left(self._target_keys, start):bisect_left(self._target_keys, stop)
+        ]
+
+    def shift(self, start: int, delta: int) -> List[Tuple[int, int]]:
+        """Moves positions at or past start by delta.
+
+        Positions that positions are moved onto must not hold references
+        or be referenced.
+
+        Args:
+            start (int): First position to move.
+            delta (int): Distance to move by.
+
+        Returns:
+            List[Tuple[int, int]]: New position and new value of each REF
+                section whose target moved.
+        """
+
+        i = bisect_left(self._ref_keys, start)
+        j = bisect_left(self._target_keys, start)
+        moved = set(self._ref_keys[i:])
+        for target in self._target_keys[j:]:
+            moved.update(self._referrers[target])
+
+        pairs = [(referrer, self._targets.pop(referrer)) for referrer in moved]
+        for referrer, target in pairs:
+            referrers = self._referrers[target]
+            referrers.discard(referrer)
+            if not referrers:
+                del self._referrers[target]
+
+        self._ref_keys[i:] = [referrer + delta for referrer in self._ref_keys[i:]]
+        self._target_keys[j:] = [target + delta for target in self._target_keys[j:]]
+
+        changed = []
+        for referrer, target in pairs:
+            if referrer >= start:
+                referrer += delta
+            if target >= start:
+                target += delta
+                changed.append((referrer, target))
+            self._targets[referrer] = target
+            self._referrers.setdefault(target, set()).add(referrer)
+
+        return changed
+
+
+class _TypeIndex:
+    """Sorted positions of the sections of each type.
+
+    Inserts and removes are logged and replayed on the positions of a type
+    the next time that type is looked up, so edits cost O(1) and repeated
+    lookups of an unchanged type return the same tuple. The index is
+    rebuilt instead when replaying would cost more than a rebuild, so a
+    lookup costs at most O(n).
+    """
+
+    def __init__(self, stypes: Iterable[SectionType]):
+        """Builds index from section types.
+
+        Args:
+            stypes (Iterable[SectionType]): Type of each section.
+        """
+
+        self._positions = {}
+        self._len = 0
+        for i, stype in enumerate(stypes):
+            self._positions.setdefault(stype, []).append(i)
+            self._len += 1
+        self._log = []
+        self._applied = {}
+        self._found = {}
+
+    def stale(self, stype: SectionType) -> bool:
+        """Checks whether a lookup of a type would cost more than a rebuild.
+
+        Replaying each logged edit may shift every position of the type,
+        while a rebuild visits every section once.
+
+        Args:
+            stype (SectionType): Section type to look up.
+
+        Returns:
+            bool: True if the index should be rebuilt.
+        """
+
+        if self._log == None:
+            return True
+
+        pending = len(self._log) - self._applied.get(stype, 0)
+        return pending * (len(self._positions.get(stype, ())) + 1) > self._len
+
+    def _record(self, idx: int, delta: int, stype: SectionType):
+        """Logs edit, dropping the index once the log outgrows it.
+
+        Args:
+            idx (int): Position of section.
+            delta (int): 1 for an insert or -1 for a remove.
+            stype (SectionType): Type of section.
+        """
+
+        if self._log == None:
+            return
+
+        self._log.append((idx, delta, stype))
+        if len(self._log) > max(self._len, 1024):
+            # A rebuild is cheaper than replaying the log for any type
+            self._log = None
+            self._positions = {}
+            self._found = {}
+
+    def insert(self, idx: int, stype: SectionType):
+        """Records inserted section.
+
+        Args:
+            idx (int): Position of new section.
+            stype (SectionType): Type of new section.
+        """
+
+        positions = self._positions.setdefault(stype, [])
+        if idx == self._len and self._log == []:
+            # Appends keep positions sorted without shifting any
+            positions.append(idx)
+            self._found.pop(stype, None)
+        else:
+            self._record(idx, 1, stype)
+        self._len += 1
+
+    def remove(self, idx: int, stype: SectionType):
+        """Records removed section.
+
+        Args:
+            idx (int): Position of removed section.
+            stype (SectionType): Type of removed section.
+        """
+
+        self._record(idx, -1, stype)
+        self._len -= 1
+
+    def _apply(self, stype: SectionType) -> List[int]:
+        """Replays logged edits on the positions of a type.
+
+        Args:
+            stype (SectionType): Section type.
+
+        Returns:
+            List[int]: Sorted positions of sections of the type.
+        """
+
+        positions = self._positions.setdefault(stype, [])
+        applied = self._applied.get(stype, 0)
+        if applied == len(self._log):
+            return positions
+
+        for j in range(applied, len(self._log)):
+            idx, delta, etype = self._log[j]
+            k = bisect_left(positions, idx)
+            if delta < 0 and etype == stype:
+                del positions[k]
+            if k < len(positions):
+                positions[k:] = [p + delta for p in positions[k:]]
+            if delta > 0 and etype == stype:
+                positions.insert(k, idx)
+
+        self._applied[stype] = len(self._log)
+        self._found.pop(stype, None)
+        if all(self._applied.get(t, 0) == len(self._log) for t in self._positions):
+            self._log.clear()
+            self._applied = {}
+
+        return positions
+
+    def find(self, stype: SectionType) -> Tuple[int, ...]:
+        """Gets positions of sections of a type.
+
+        Args:
+            stype (SectionType): Section type.
+
+        Returns:
+            Tuple[int, ...]: Sorted positions.
+        """
+
+        positions = self._apply(stype)
+        found = self._found.get(stype)
+        if found == None:
+            found = self._found[stype] = tuple(positions)
+        return found
+
+    def first(self, stype: SectionType) -> Union[int, None]:
+        """Gets position of first section of a type.
+
+        Args:
+            stype (SectionType): Section type.
+
+        Returns:
+            Union[int, None]: Position, or None if there is no section of the type.
+        """
+
+        positions = self._apply(stype)
+        return positions[0] if positions else None
+
+
+class FPFF:
+    """FPFF file.
+
+    Attributes:
+        version (int): FPFF version number. Only accepts 1.
+        timestamp (int): UNIX timestamp indicating time of creation.
+        author (str): Author name.
+        sections (MutableSequence[Section]): Sections of the FPFF. Sections
+            should only be changed through FPFF methods and the ``stypes``
+            and ``svalues`` views, which keep references up to date.
+    """
+
+    def __init__(self, file: Union[BinaryIO, None] = None, author: str = '',
+                 as_array: bool = False):
+        """Initializes new FPFF.
+
+        Args:
+            file (BinaryIO): Optional FPFF input byte stream. Provided if reading FPFF.
+            author (str): Author name. Defaults to ''.
+            as_array (bool): Read doubles as arrays instead of lists. Defaults to False.
+
+        Example:
+            >>> with open('./input.fpff', 'rb') as f:
+            >>>     fpff = FPFF(f)
+        """
+
+        self.version = 1
+        self.timestamp = int(time.time())
+        self.author = author
+        self._refs = None
+        self._types = None
+        self._resolved = {}
+        self.sections = _BlockList()
+        self._source = None
+
+        # Read FPFF file if supplied
+        if file != None:
+            self.read(file, as_array)
+
+    def read(self, file: BinaryIO, as_array: bool = False):
+        """Reads in FPFF from byte stream.
+
+        Args:
+            file (BinaryIO): FPFF input byte stream.
+            as_array (bool): Decode doubles to a read-only NumPy array when NumPy is
+                installed, or to an ``array('d')`` otherwise, instead of a list.
+                Defaults to False.
+
+        Raises:
+            ValueError: Magic did not match FPFF magic.
+            ValueError: Unsupported version. Only version 1 is supported.
+            ValueError: Section length must be greater than 0.
+            ValueError: Improper section length.
+            ValueError: Reference value is out of bounds.
+            ValueError: File contained an unsupported type.
+            ValueError: Section extends past end of file.
+
+        Example:
+            >>> with open('./input.fpff', 'rb') as f:
+            >>>     fpff = FPFF()
+            >>>     fpff.read(f)
+        """
+
+        self.version, self.timestamp, self.author, nsects = \
+            _read_header(file)
+        stypes = []
+        sections = []
+
+        # Read each section
+        for stype, svalue in _iter_payloads(file, nsects):
+            stypes.append(stype)
+            sections.append(Section(
+                stype, _decode_section(stype, svalue, nsects, as_array)
+            ))
+
+        self.sections = _BlockList(sections)
+        self._types = _TypeIndex(stypes)
+
+    @property
+    def sections(self) -> MutableSequence:
+        """MutableSequence[Section]: Sections of the FPFF. Assigned sequences
+        are copied into a new section table."""
+
+        return self._sections
+
+    @sections.setter
+    def sections(self, sections: Iterable):
+        if not isinstance(sections, _BlockList):
+            sections = _BlockList(sections)
+        self._sections = sections
+        self._refs = None
+        self._types = None
+        self._resolved = {}
+
+    @property
+    def nsects(self) -> int:
+        """int: Number of sections in the FPFF."""
+
+        return len(self.sections)
+
+    @property
+    def stypes(self) -> MutableSequence:
+        """MutableSequence[SectionType]: View of section types indexed by section."""
+
+        return _SectionView(self, 'stype')
+
+    @property
+    def svalues(self) -> MutableSequence:
+        """MutableSequence[Any]: View of section values indexed by section."""
+
+        return _SectionView(self, 'value')
+
+    @classmethod
+    async def aread(cls, reader: asyncio.StreamReader, as_array: bool = False) -> 'FPFF':
+        """Reads in FPFF from asyncio stream.
+
+        Args:
+            reader (asyncio.StreamReader): FPFF input stream, such as one from
+                ``asyncio.open_connection``.
+            as_array (bool): Decode doubles to arrays instead of lists. See :meth:`FPFF.read`.
+                Defaults to False.
+
+        Raises:
+            ValueError: Magic did not match FPFF magic.
+            ValueError: Unsupported version. Only version 1 is supported.
+            ValueError: Section length must be greater than 0.
+            ValueError: Improper section length.
+            ValueError: Reference value is out of bounds.
+            ValueError: File contained an unsupported type.
+            ValueError: Section extends past end of file.
+
+        Returns:
+            FPFF: Decoded FPFF.
+
+        Example:
+            >>> reader, writer = await asyncio.open_connection(host, port)
+            >>> fpff = await FPFF.aread(reader)
+        """
+
+        fpff = cls()
+        fpff.version, fpff.timestamp, fpff.author, nsects = \
+            await _aread_header(reader)
+        stypes = []
+        sections = []
+
+        # Read each section
+        async for stype, svalue in _aiter_payloads(reader, nsects):
+            stypes.append(stype)
+            sections.append(Section(
+                stype, _decode_section(stype, svalue, nsects, as_array)
+            ))
+
+        fpff.sections = _BlockList(sections)
+        fpff._types = _TypeIndex(stypes)
+
+        return fpff
+
+    @classmethod
+    def open(cls, file: Union[str, BinaryIO], use_mmap: bool = False,
+             as_array: bool = False, use_index: bool = True) -> 'FPFF':
+        """Opens FPFF lazily.
+
+        Only section headers are scanned on open. Each section is decoded on
+        first access and the source stream must stay open until then.
+
+        Args:
+            file (Union[str, BinaryIO]): Path to FPFF or seekable FPFF input byte stream.
+                Paths are opened and closed by the FPFF.
+            use_mmap (bool): Memory map the file instead of seeking and reading.
+                Raw payloads from :meth:`FPFF.raw` are then zero-copy. Defaults to False.
+            as_array (bool): Decode doubles to arrays instead of lists. See :meth:`FPFF.read`.
+                Defaults to False.
+            use_index (bool): Load the section table from a fresh sidecar index
+                written by :func:`write_index` instead of scanning, when opening
+                a path. Defaults to True.
+
+        Raises:
+            ValueError: Magic did not match FPFF magic.
+            ValueError: Unsupported version. Only version 1 is supported.
+            ValueError: Section length must be greater than 0.
+            ValueError: Improper section length.
+            ValueError: File contained an unsupported type.
+            ValueError: Section extends past end of file.
+
+        Returns:
+            FPFF: FPFF with sections decoded on access.
+
+        Example:
+            >>> with FPFF.open('./input.fpff', use_mmap=True) as fpff:
+            >>>     print(fpff[0])
+        """
+
+        sections = None
+        if use_index and isinstance(file, (str, os.PathLike)):
+            entries = read_index(file)
+            if entries != None:
+                sections = [
+                    Section._from_source(entry.stype, entry.offset, entry.length)
+                    for entry in entries
+                ]
+
+        return cls._open(file, use_mmap, as_array, sections)
+
+    @classmethod
+    def _open(cls, file: Union[str, BinaryIO], use_mmap: bool = False,
+              as_array: bool = False,
+              sections: Union[List[Section], None] = None) -> 'FPFF':
+        """Opens FPFF lazily, optionally from a known section table.
+
+        Args:
+            file (Union[str, BinaryIO]): Path to FPFF or seekable FPFF input byte stream.
+            use_mmap (bool): Memory map the file. Defaults to False.
+            as_array (bool): Decode doubles to arrays instead of lists. Defaults to False.
+            sections (List[Section]): Undecoded sections from an earlier scan of the same file.
+                Scanned from the file if None or if its length does not match
+                the header. Defaults to None.
+
+        Returns:
+            FPFF: FPFF with sections decoded on access.
+        """
+
+        fpff = cls()
+        owned = isinstance(file, (str, os.PathLike))
+        if owned:
+            file = open(file, 'rb')
+
+        try:
+            fpff.version, fpff.timestamp, fpff.author, nsects = \
+                _read_header(file)
+            source = _Source(file, use_mmap, owned, nsects, as_array)
+        except BaseException:
+            if owned:
+                file.close()
+            raise
+
+        if sections == None or len(sections) != nsects:
+            try:
+                sections = _scan_sections(source, file.tell(), nsects)
+            except BaseException:
+                source.close()
+                raise
+        else:
+            for section in sections:
+                section._source = source
+
+        fpff.sections = _BlockList(sections)
+        fpff._types = _TypeIndex(section.stype for section in sections)
+        fpff._source = source
+
+        return fpff
+
+    def close(self):
+        """Closes source opened by :meth:`FPFF.open`.
+
+        Sections not yet decoded can no longer be accessed afterwards.
+        Streams passed in by the caller are left open.
+        """
+
+        if self._source != None:
+            self._source.close()
+            self._source = None
+
+    def _located(self, section_idx: int) -> Union[Section, None]:
+        """Gets unmodified section whose payload can be read from its source.
+
+        Args:
+            section_idx (int): Section index.
+
+        Returns:
+            Union[Section, None]: Section, or None if section may have been
+                modified, was not read from a source or its source is closed.
+        """
+
+        section = self.sections[section_idx]
+        return section if section._located() else None
+
+    def raw(self, section_idx: int) -> memoryview:
+        """Gets raw payload of section.
+
+        Unmodified sections of an FPFF from :meth:`FPFF.open` are read from
+        the source, without copying if memory mapped. Other sections are
+        encoded from their values.
+
+        Args:
+            section_idx (int): Section index.
+
+        Raises:
+            ValueError: Word needs to be 4 bytes.
+            ValueError: DWord needs to be 8 bytes.
+
+        Returns:
+            memoryview: Section payload, without media signature.
+
+        Example:
+            >>> with FPFF.open('./input.fpff', use_mmap=True) as fpff:
+            >>>     payload = fpff.raw(0)
+        """
+
+        return self.sections[section_idx].raw()
+
+    def __enter__(self) -> 'FPFF':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, file: BinaryIO):
+        """Writes FPFF to byte stream.
+
+        Unmodified sections of an FPFF from :meth:`FPFF.open` are copied from
+        the source file byte for byte instead of being encoded again. Sections
+        count as modified once replaced, or once decoded to a value that can
+        be changed in place, such as a list. The output must not be the source
+        file.
+
+        Args:
+            file (BinaryIO): FPFF output byte stream.
+
+        Raises:
+            ValueError: Author must be at most 8 bytes.
+            ValueError: Word needs to be 4 bytes.
+            ValueError: DWord needs to be 8 bytes.
+
+        Example:
+            >>> with open('./output.fpff', 'wb') as out_f:
+            >>>     fpff = FPFF()
+            >>>     fpff.append(SectionType.ASCII, 'Hello, world!')
+            >>>     fpff.write(out_f)
+        """
+
+        # Write FPFF header
+        _write_header(
+            file, self.version, self.timestamp, self.author, self.nsects
+        )
+
+        # Write each section
+        sections = iter(self.sections)
+        section = next(sections, None)
+        while section != None:
+            if not section._located():
+                _write_section(file, section.stype, section.raw())
+                section = next(sections, None)
+                continue
+
+            # Copy run of unmodified sections that are contiguous in the
+            # source, including their headers, in one go
+            source = section._source
+            start = section.offset - 8
+            end = section.offset + section.length
+            section = next(sections, None)
+            while section != None:
+                if not section._located() or section._source is not source \
+                        or section.offset - 8 != end:
+                    break
+                end = section.offset + section.length
+                section = next(sections, None)
+
+            _copy_range(source, start, end - start, file)
+
+    async def awrite(self, writer: asyncio.StreamWriter):
+        """Writes FPFF to asyncio stream.
+
+        Each section is followed by a drain of the stream, so no more than
+        about one section is buffered when the peer reads slowly. Unmodified
+        sections of an FPFF from :meth:`FPFF.open` are read from the source
+        without decoding.
+
+        Args:
+            writer (asyncio.StreamWriter): FPFF output stream. Left open.
+
+        Raises:
+            ValueError: Author must be at most 8 bytes.
+            ValueError: Word needs to be 4 bytes.
+            ValueError: DWord needs to be 8 bytes.
+
+        Example:
+            >>> reader, writer = await asyncio.open_connection(host, port)
+            >>> await fpff.awrite(writer)
+        """
+
+        _write_header(
+            writer, self.version, self.timestamp, self.author, self.nsects
+        )
+        await writer.drain()
+
+        for section in self.sections:
+            _write_section(writer, section.stype, section.raw())
+            await writer.drain()
+
+    def export(self, output_path: str, workers: Union[int, None] = None,
+               incremental: bool = False):
+        """Exports FPFF sections to directory.
+
+        Args:
+            output_path (str): Path to export directory.
+            workers (int): Number of threads writing section files. Sections
+                are written one after another if None. Defaults to None.
+            incremental (bool): Update an earlier export in place instead of
+                recreating the directory. Content digests of section files are
+                kept in a manifest in the directory, and only section files
+                whose content changed are rewritten. Section files no longer
+                exported are deleted, including any section files already in a
+                directory without a manifest. Defaults to False.
+
+        Example:
+            >>> with open('./input.fpff') as f:
+            >>>     fpff = FPFF(f)
+            >>>     fpff.export('./exported', workers=8, incremental=True)
+        """
+
+        manifest_path = os.path.join(output_path, _MANIFEST_NAME)
+        manifest = None
+
+        # Ensure output path exists
+        if incremental:
+            manifest = {}
+            os.makedirs(output_path, exist_ok=True)
+            if os.path.exists(manifest_path):
+                with open(manifest_path, 'r', encoding='utf8') as f:
+                    manifest = json.load(f)
+                exported = manifest.keys()
+            else:
+                # Directory is not tracked yet, so any section file in it
+                # may be left over from an earlier export
+                exported = {
+                    file_name for file_name in os.listdir(output_path)
+                    if file_name.startswith('section-')
+                }
+        else:
+            if os.path.exists(output_path):
+                shutil.rmtree(output_path)
+            os.mkdir(output_path)
+
+        # Export files
+        export_section = partial(self._export_section, output_path, manifest)
+        if workers == None:
+            digests = dict(map(export_section, range(self.nsects)))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                digests = dict(executor.map(export_section, range(self.nsects)))
+
+        if incremental:
+            # Delete section files that are no longer exported
+            for file_name in exported - digests.keys():
+                file_path = os.path.join(output_path, file_name)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+            tmp_path = manifest_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf8') as f:
+                json.dump(digests, f)
+            os.replace(tmp_path, manifest_path)
+
+    def _export_section(self, output_path: str, manifest: Union[Dict[str, str], None],
+                        i: int) -> Tuple[str, str]:
+        """Exports section to file in directory.
+
+        Args:
+            output_path (str): Path to export directory.
+            manifest (Dict[str, str]): Content digests from an earlier export by file name.
+                Files with matching digests are not rewritten. Digests are not
+                computed if None.
+            i (int): Section index.
+
+        Returns:
+            Tuple[str, str]: File name and content digest. Digest is None if
+                there is no manifest.
+        """
+
+        section = self._located(i)
+        if section != None and section.stype in _MEDIA_SIGS:
+            return self._export_media(output_path, manifest, i, section)
+
+        file_name, output = self._export_content(i)
+        file_path = os.path.join(output_path, file_name)
+
+        digest = None
+        if manifest != None:
+            digest = hashlib.blake2b(
+                output.encode('utf8') if type(output) == str else output,
+                digest_size=16
+            ).hexdigest()
+            if manifest.get(file_name) == digest and os.path.exists(file_path):
+                return file_name, digest
+
+        if type(output) == str:
+            with open(file_path, 'w', encoding='utf8') as f:
+                f.write(output)
+        else:
+            with open(file_path, 'wb') as f:
+                f.write(output)
+
+        return file_name, digest
+
+    def _export_media(self, output_path: str, manifest: Union[Dict[str, str], None],
+                      i: int, section: Section) -> Tuple[str, str]:
+        """Exports unmodified media section straight from source.
+
+        Payload is copied from the source file in the kernel where possible
+        instead of being decoded into memory.
+
+        Args:
+            output_path (str): Path to export directory.
+            manifest (Dict[str, str]): Content digests from an earlier export by file name.
+            i (int): Section index.
+            section (Section): Unmodified section located in source.
+
+        Returns:
+            Tuple[str, str]: File name and content digest.
+        """
+
+        source = section._source
+        sig = _MEDIA_SIGS[section.stype]
+        if section.stype == SectionType.PNG:
+            file_name = f'section-{i}.png'
+        else:
+            file_name = f'section-{i}.gif'
+        file_path = os.path.join(output_path, file_name)
+
+        digest = None
+        if manifest != None:
+            h = hashlib.blake2b(sig, digest_size=16)
+            for chunk in _iter_range(source, section.offset, section.length):
+                h.update(chunk)
+            digest = h.hexdigest()
+            if manifest.get(file_name) == digest and os.path.exists(file_path):
+                return file_name, digest
+
+        with open(file_path, 'wb') as f:
+            f.write(sig)
+            _copy_range(source, section.offset, section.length, f)
+
+        return file_name, digest
+
+    def _export_content(self, i: int) -> Tuple[str, Union[str, bytes]]:
+        """Formats section for export.
+
+        Args:
+            i (int): Section index.
+
+        Returns:
+            Tuple[str, Union[str, bytes]]: File name and file content.
+                Content is text for non-media sections.
+        """
+
+        section = self.sections[i]
+        stype = section.stype
+        svalue = section.value
+
+        if stype not in [SectionType.PNG, SectionType.GIF87, SectionType.GIF89]:
+            # Non-media section
+            file_name = f'section-{i}.txt'
+            output = ''
+            if stype == SectionType.ASCII:
+                output = svalue
+            elif stype == SectionType.UTF8:
+                output = svalue
+            elif stype == SectionType.WORDS:
+                output = ', '.join(
+                    [val.hex() for val in svalue]
+                )
+            elif stype == SectionType.DWORDS:
+                output = ', '.join(
+                    [val.hex() for val in svalue]
+                )
+            elif stype == SectionType.DOUBLES:
+                output = ', '.join(
+                    [str(val) for val in svalue]
+                )
+            elif stype == SectionType.COORD:
+                output = f'LAT: {str(svalue[0])}\nLNG: {str(svalue[1])}'
+            elif stype == SectionType.REF:
+                output = f'REF: {str(svalue)}'
+
+            return file_name, output
+
+        else:
+            # Media section
+            if stype == SectionType.PNG:
+                file_name = f'section-{i}.png'
+            else:
+                file_name = f'section-{i}.gif'
+
+            return file_name, svalue
+
+    def _ref_index(self) -> _RefIndex:
+        """Gets reverse reference index, building it on first use.
+
+        Returns:
+            _RefIndex: Reverse reference index.
+        """
+
+        if self._refs == None:
+            self._refs = _RefIndex(self.sections)
+        return self._refs
+
+    def _shift(self, start: int, delta: int):
+        """Moves sections at or past start in the indexes and remaps references to them.
+
+        Args:
+            start (int): First section position to move.
+            delta (int): Distance to move by.
+        """
+
+        for referrer, target in self._refs.shift(start, delta):
+            self.sections[referrer].value = target
+
+    def _set(self, section_idx: int, attr: str, value: Any):
+        """Sets section attribute and keeps indexes up to date.
+
+        Args:
+            section_idx (int): Section index.
+            attr (str): Section attribute.
+            value (Any): New attribute value.
+        """
+
+        section = self.sections[section_idx]
+        if section_idx < 0:
+            section_idx += self.nsects
+
+        self._resolved.clear()
+        if self._refs != None:
+            self._refs.discard(section_idx)
+        if self._types != None and attr == 'stype':
+            self._types.remove(section_idx, section.stype)
+        setattr(section, attr, value)
+        if self._refs != None and section.stype == SectionType.REF:
+            self._refs.add(section_idx, section.value)
+        if self._types != None and attr == 'stype':
+            self._types.insert(section_idx, section.stype)
+
+    def referrers(self, section_idx: int) -> List[int]:
+        """Gets indices of REF sections referencing a section.
+
+        Args:
+            section_idx (int): Section index.
+
+        Returns:
+            List[int]: Indices of REF sections in order.
+
+        Example:
+            >>> fpff.referrers(0)
+        """
+
+        if section_idx < 0:
+            section_idx += self.nsects
+        return sorted(self._ref_index().referrers(section_idx))
+
+    def _type_index(self, stype: SectionType) -> _TypeIndex:
+        """Gets type index, building it when missing or stale.
+
+        Args:
+            stype (SectionType): Section type about to be looked up.
+
+        Returns:
+            _TypeIndex: Type index.
+        """
+
+        if self._types == None or self._types.stale(stype):
+            self._types = _TypeIndex(section.stype for section in self.sections)
+        return self._types
+
+    def find(self, stype: SectionType) -> Tuple[int, ...]:
+        """Gets indices of sections of a type.
+
+        Section types are indexed on read and open, from section headers
+        alone, and the index is kept up to date by edits. Repeated lookups
+        of a type that has not changed return the same tuple.
+
+        Args:
+            stype (SectionType): Section type.
+
+        Returns:
+            Tuple[int, ...]: Section indices in order.
+
+        Example:
+            >>> fpff.find(SectionType.COORD)
+        """
+
+        return self._type_index(stype).find(stype)
+
+    def find_first(self, stype: SectionType) -> Union[int, None]:
+        """Gets index of first section of a type.
+
+        Args:
+            stype (SectionType): Section type.
+
+        Returns:
+            Union[int, None]: Section index, or None if there is no section of the type.
+
+        Example:
+            >>> fpff.find_first(SectionType.PNG)
+        """
+
+        return self._type_index(stype).first(stype)
+
+    def resolve(self, section_idx: int) -> int:
+        """Follows chain of REF sections to the section it ends at.
+
+        Resolved chains are memoized, with every REF section on a chain
+        pointing straight at its end, until the FPFF is next edited.
+
+        Args:
+            section_idx (int): Section index.
+
+        Raises:
+            IndexError: List index out of range.
+            ValueError: Reference value is out of bounds.
+            ValueError: Reference cycle detected.
+
+        Returns:
+            int: Index of the first non-REF section on the chain. The index
+                itself if the section is not a REF section.
+
+        Example:
+            >>> fpff.resolve(0)
+        """
+
+        self.sections[section_idx]
+        if section_idx < 0:
+            section_idx += self.nsects
+
+        resolved = self._resolved
+        path = []
+        visited = set()
+        i = section_idx
+        while True:
+            end = resolved.get(i)
+            if end != None:
+                i = end
+                break
+            section = self.sections[i]
+            if section.stype != SectionType.REF:
+                break
+            if i in visited:
+                raise ValueError("Reference cycle detected.")
+            path.append(i)
+            visited.add(i)
+
+            i = section.value
+            if type(i) != int or i < 0 or i >= self.nsects:
+                raise ValueError("Reference value is out of bounds.")
+
+        for j in path:
+            resolved[j] = i
+        return i
+
+    def insert(self, section_idx: int, obj_type: SectionType, obj_data: Any):
+        """Inserts section before indicated index.
+
+        References to sections at or after the index are remapped to follow
+        them. The value of a new REF section is the index of its target
+        after the insert.
+
+        Args:
+            section_idx (int): Section index to insert in front of.
+            obj_type (int): Section type of new section.
+            obj_data (Any): Section value of new section.
+
+        Raises:
+            TypeError: Object data not valid for object type.
+
+        Example:
+            >>> fpff.insert(0, SectionType.ASCII, 'Hello, world!')
+        """
+
+        _check_value(obj_type, obj_data)
+
+        # Clamp like list.insert
+        if section_idx < 0:
+            section_idx = max(section_idx + self.nsects, 0)
+        section_idx = min(section_idx, self.nsects)
+
+        if section_idx < self.nsects:
+            # Sections move, so memoized chains may be wrong
+            self._resolved.clear()
+
+        refs = self._ref_index()
+        self.sections.insert(section_idx, Section(obj_type, obj_data))
+        self._shift(section_idx, 1)
+        if obj_type == SectionType.REF:
+            refs.add(section_idx, obj_data)
+        if self._types != None:
+            self._types.insert(section_idx, obj_type)
+
+    def append(self, obj_type: SectionType, obj_data: Any):
+        """Appends section.
+
+        Args:
+            obj_type (int): Section type of new section.
+            obj_data (Any): Section value of new section.
+
+        Example:
+            >>> fpff.append(SectionType.ASCII, 'Hello, world!')
+        """
+
+        self.insert(self.nsects, obj_type, obj_data)
+
+    def extend(self, sections: Iterable[Tuple[SectionType, Any]],
+               validate: bool = True):
+        """Appends many sections in one step.
+
+        Args:
+            sections (Iterable[Tuple[SectionType, Any]]): Section types and values to append.
+            validate (bool): Check each value is valid for its type. Only skip
+                for trusted producers. Defaults to True.
+
+        Raises:
+            TypeError: Object data not valid for object type. No sections are
+                appended.
+
+        Example:
+            >>> fpff.extend([(SectionType.ASCII, 'a'), (SectionType.REF, 0)])
+        """
+
+        value_types = _VALUE_TYPES
+        new_sections = []
+        for obj_type, obj_data in sections:
+            if validate and type(obj_data) not in value_types.get(obj_type, ()):
+                raise TypeError("Object data not valid for object type.")
+            new_sections.append(Section(obj_type, obj_data))
+
+        self._append_sections(new_sections)
+
+    def extend_doubles(self, values: Iterable[Any], validate: bool = True):
+        """Appends many DOUBLES sections in one step.
+
+        Args:
+            values (Iterable[Any]): Lists or arrays of doubles, one per section.
+            validate (bool): Check each value is a list or array. Defaults to True.
+
+        Raises:
+            TypeError: Object data not valid for object type. No sections are
+                appended.
+
+        Example:
+            >>> fpff.extend_doubles([array('d', [0.5, 1.5]), [2.5]])
+        """
+
+        if validate:
+            value_types = _VALUE_TYPES[SectionType.DOUBLES]
+            values = list(values)
+            for obj_data in values:
+                if type(obj_data) not in value_types:
+                    raise TypeError("Object data not valid for object type.")
+
+        self._append_sections([
+            Section(SectionType.DOUBLES, obj_data) for obj_data in values
+        ])
+
+    def _append_sections(self, sections: List[Section]):
+        """Appends sections and adds them to the indexes.
+
+        Args:
+            sections (List[Section]): New sections.
+        """
+
+        start = self.nsects
+        self.sections.extend(sections)
+        if self._refs != None or self._types != None:
+            for i, section in enumerate(sections, start):
+                if self._refs != None and section.stype == SectionType.REF:
+                    self._refs.add(i, section.value)
+                if self._types != None:
+                    self._types.insert(i, section.stype)
+
+    def remove(self, section_idx: int, cascade: bool = False):
+        """Removes section at index.
+
+        References to sections after the index are remapped to follow them.
+
+        Args:
+            section_idx (int): Index of section to remove.
+            cascade (bool): Also remove REF sections referencing the section,
+                and in turn the REF sections referencing them. Defaults to False.
+
+        Raises:
+            IndexError: List index out of range.
+            ValueError: Section is referenced. Raised unless cascading.
+
+        Example:
+            >>> fpff.remove(0)
+        """
+
+        self.sections[section_idx]
+        if section_idx < 0:
+            section_idx += self.nsects
+
+        refs = self._ref_index()
+        removed = {section_idx}
+        pending = [i for i in refs.referrers(section_idx) if i != section_idx]
+        if pending and not cascade:
+            raise ValueError("Section is referenced.")
+        while pending:
+            i = pending.pop()
+            if i not in removed:
+                removed.add(i)
+                pending.extend(refs.referrers(i))
+
+        self._resolved.clear()
+        for i in removed:
+            refs.discard(i)
+        for i in sorted(removed, reverse=True):
+            if self._types != None:
+                self._types.remove(i, self.sections[i].stype)
+            del self.sections[i]
+            self._shift(i + 1, -1)
+
+    def splice(self, section_idx: int, count: int,
+               sections: Iterable[Tuple[SectionType, Any]] = ()):
+        """Replaces sections in range with new sections in one step.
+
+        References to sections after the range are remapped to follow them.
+        The values of new REF sections are the indices of their targets after
+        the splice.
+
+        Args:
+            section_idx (int): Index of first section to replace.
+            count (int): Number of sections to remove.
+            sections (Iterable[Tuple[SectionType, Any]]): Section types and values
+                to insert in place of the removed sections. Defaults to empty.
+
+        Raises:
+            TypeError: Object data not valid for object type.
+            ValueError: Section is referenced. Raised if a removed section is
+                referenced by a section that is not removed.
+
+        Example:
+            >>> fpff.splice(0, 2, [(SectionType.ASCII, 'Hello, world!')])
+        """
+
+        sections = list(sections)
+        for obj_type, obj_data in sections:
+            _check_value(obj_type, obj_data)
+
+        if section_idx < 0:
+            section_idx = max(section_idx + self.nsects, 0)
+        section_idx = min(section_idx, self.nsects)
+        stop = min(section_idx + max(count, 0), self.nsects)
+
+        refs = self._ref_index()
+        for target in refs.targets(section_idx, stop):
+            for referrer in refs.referrers(target):
+                if referrer < section_idx or referrer >= stop:
+                    raise ValueError("Section is referenced.")
+
+        if section_idx < self.nsects:
+            # Sections are replaced or move, so memoized chains may be wrong
+            self._resolved.clear()
+        for i in range(section_idx, stop):
+            refs.discard(i)
+        if self._types != None:
+            for i in range(stop - 1, section_idx - 1, -1):
+                self._types.remove(i, self.sections[i].stype)
+        self.sections.splice(section_idx, stop, [
+            Section(obj_type, obj_data) for obj_type, obj_data in sections
+        ])
+        self._shift(stop, len(sections) - (stop - section_idx))
+        for i, (obj_type, obj_data) in enumerate(sections, section_idx):
+            if obj_type == SectionType.REF:
+                refs.add(i, obj_data)
+            if self._types != None:
+                self._types.insert(i, obj_type)
+
+    def __getitem__(self, section_idx: int) -> Any:
+        """Gets section value at index.
+
+        Args:
+            section_idx (int): Section index.
+
+        Returns:
+            Any: Section value.
+        """
+
+        return self.sections[section_idx].value
+
+    def __repr__(self) -> str:
+        """String representation of FPFF.
+
+        Returns:
+            string: String representation of FPFF.
+        """
+
+        return str(self.stypes)
+
+
+class FPFFWriter:
+    """Incremental FPFF writer.
+
+    Sections are encoded and written as they are appended instead of being
+    held in memory. The section count in the header is patched on close.
+
+    Attributes:
+        nsects (int): Number of sections written so far.
+    """
+
+    def __init__(self, file: Union[str, BinaryIO], author: str = '',
+                 timestamp: Union[int, None] = None):
+        """Initializes writer and writes FPFF header.
+
+        Args:
+            file (Union[str, BinaryIO]): Path to FPFF or seekable FPFF output byte stream.
+                Paths are opened and closed by the writer.
+            author (str): Author name. Defaults to ''.
+            timestamp (int): UNIX timestamp indicating time of creation. Defaults to now.
+
+        Raises:
+            ValueError: Author must be at most 8 bytes.
+
+        Example:
+            >>> with FPFFWriter('./output.fpff', author='jasmaa') as writer:
+            >>>     writer.append(SectionType.ASCII, 'Hello, world!')
+        """
+
+        self._owned = isinstance(file, (str, os.PathLike))
+        if self._owned:
+            file = open(file, 'wb')
+
+        self.file = file
+        self.nsects = 0
+        self._start = file.tell()
+
+        if timestamp == None:
+            timestamp = int(time.time())
+
+        try:
+            _write_header(file, 1, timestamp, author, 0)
+        except BaseException:
+            if self._owned:
+                file.close()
+            raise
+
+    def append(self, obj_type: SectionType, obj_data: Any):
+        """Encodes and writes section.
+
+        Args:
+            obj_type (SectionType): Section type of new section.
+            obj_data (Any): Section value of new section.
+
+        Raises:
+            ValueError: Writer is closed.
+            TypeError: Object data not valid for object type.
+            ValueError: Word needs to be 4 bytes.
+            ValueError: DWord needs to be 8 bytes.
+
+        Example:
+            >>> writer.append(SectionType.ASCII, 'Hello, world!')
+        """
+
+        if self.file == None:
+            raise ValueError("Writer is closed.")
+
+        _check_value(obj_type, obj_data)
+        _write_section(self.file, obj_type, _encode_section(obj_type, obj_data))
+        self.nsects += 1
+
+    def append_raw(self, obj_type: SectionType, payload: Any):
+        """Writes section from raw payload without encoding.
+
+        Args:
+            obj_type (SectionType): Section type of new section.
+            payload (Any): Section payload as a bytes-like object, without media signature.
+
+        Raises:
+            ValueError: Writer is closed.
+            ValueError: Section length must be greater than 0.
+            ValueError: Improper section length.
+            ValueError: File contained an unsupported type.
+
+        Example:
+            >>> writer.append_raw(SectionType.ASCII, b'Hello, world!')
+        """
+
+        if self.file == None:
+            raise ValueError("Writer is closed.")
+
+        payload = memoryview(payload).cast('B')
+        obj_type = _check_section(obj_type, len(payload))
+        _write_section(self.file, obj_type, payload)
+        self.nsects += 1
+
+    def _copy_section(self, fpff: FPFF, section_idx: int):
+        """Copies section from FPFF without decoding.
+
+        Unmodified sections of an FPFF from :meth:`FPFF.open` are copied
+        from the source file in the kernel where possible.
+
+        Args:
+            fpff (FPFF): Source FPFF.
+            section_idx (int): Index of section in source FPFF.
+
+        Raises:
+            ValueError: Writer is closed.
+        """
+
+        if self.file == None:
+            raise ValueError("Writer is closed.")
+
+        section = fpff.sections[section_idx]
+        if section._located():
+            self._copy_source(section)
+        else:
+            self.append_raw(section.stype, section.raw())
+
+    def _copy_source(self, section: Section):
+        """Copies section header and payload from source.
+
+        Args:
+            section (Section): Unmodified section located in source.
+        """
+
+        _copy_range(
+            section._source, section.offset - 8, section.length + 8, self.file
+        )
+        self.nsects += 1
+
+    def close(self):
+        """Patches section count into header and closes owned stream.
+
+        Streams passed in by the caller are left open.
+        """
+
+        if self.file == None:
+            return
+
+        end = self.file.tell()
+        self.file.seek(self._start + 20)
+        self.file.write(self.nsects.to_bytes(4, 'little'))
+        self.file.seek(end)
+
+        if self._owned:
+            self.file.close()
+        self.file = None
+
+    def __enter__(self) -> 'FPFFWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class AsyncFPFFWriter:
+    """Incremental FPFF writer for asyncio streams.
+
+    Streams cannot be seeked back to patch the header, so the number of
+    sections is given up front. Each append drains the stream, so no more
+    than about one section is buffered when the peer reads slowly.
+
+    Attributes:
+        nsects (int): Number of sections written so far.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, nsects: int, author: str = '',
+                 timestamp: Union[int, None] = None):
+        """Initializes writer and writes FPFF header.
+
+        Args:
+            writer (asyncio.StreamWriter): FPFF output stream. Left open.
+            nsects (int): Number of sections that will be written.
+            author (str): Author name. Defaults to ''.
+            timestamp (int): UNIX timestamp indicating time of creation. Defaults to now.
+
+        Raises:
+            ValueError: Author must be at most 8 bytes.
+
+        Example:
+            >>> async with AsyncFPFFWriter(writer, 1, author='jasmaa') as fpff_writer:
+            >>>     await fpff_writer.append(SectionType.ASCII, 'Hello, world!')
+        """
+
+        if timestamp == None:
+            timestamp = int(time.time())
+
+        _write_header(writer, 1, timestamp, author, nsects)
+        self.writer = writer
+        self.nsects = 0
+        self._expected = nsects
+
+    def _check_open(self):
+        if self.writer == None:
+            raise ValueError("Writer is closed.")
+        if self.nsects >= self._expected:
+            raise ValueError("Section count does not match header.")
+
+    async def append(self, obj_type: SectionType, obj_data: Any):
+        """Encodes and writes section.
+
+        Args:
+            obj_type (SectionType): Section type of new section.
+            obj_data (Any): Section value of new section.
+
+        Raises:
+            ValueError: Writer is closed.
+            ValueError: Section count does not match header.
+            TypeError: Object data not valid for object type.
+            ValueError: Word needs to be 4 bytes.
+            ValueError: DWord needs to be 8 bytes.
+
+        Example:
+            >>> await fpff_writer.append(SectionType.ASCII, 'Hello, world!')
+        """
+
+        self._check_open()
+        _check_value(obj_type, obj_data)
+        _write_section(self.writer, obj_type, _encode_section(obj_type, obj_data))
+        self.nsects += 1
+        await self.writer.drain()
+
+    async def append_raw(self, obj_type: SectionType, payload: Any):
+        """Writes section from raw payload without encoding.
+
+        Args:
+            obj_type (SectionType): Section type of new section.
+            payload (Any): Section payload as a bytes-like object, without media signature.
+
+        Raises:
+            ValueError: Writer is closed.
+            ValueError: Section count does not match header.
+            ValueError: Section length must be greater than 0.
+            ValueError: Improper section length.
+            ValueError: File contained an unsupported type.
+
+        Example:
+            >>> await fpff_writer.append_raw(SectionType.ASCII, b'Hello, world!')
+        """
+
+        self._check_open()
+        payload = memoryview(payload).cast('B')
+        obj_type = _check_section(obj_type, len(payload))
+        _write_section(self.writer, obj_type, payload)
+        self.nsects += 1
+        await self.writer.drain()
+
+    async def close(self):
+        """Checks every section was written and drains the stream.
+
+        The stream is left open.
+
+        Raises:
+            ValueError: Section count does not match header.
+        """
+
+        if self.writer == None:
+            return
+
+        writer = self.writer
+        self.writer = None
+        if self.nsects != self._expected:
+            raise ValueError("Section count does not match header.")
+        await writer.drain()
+
+    async def __aenter__(self) -> 'AsyncFPFFWriter':
+        return self
+
+    async def __aexit__(self, exc_type, *args):
+        if exc_type == None:
+            await self.close()
+        else:
+            self.writer = None
+
+
+class FPFFHeader(NamedTuple):
+    """FPFF header record returned by :func:`peek_header`.
+
+    Attributes:
+        version (int): FPFF version number.
+        timestamp (int): UNIX timestamp indicating time of creation.
+        author (str): Author name.
+        nsects (int): Number of sections in the FPFF.
+        histogram (Dict[SectionType, int]): Number of sections of each type, or None if not requested.
+    """
+
+    version: int
+    timestamp: int
+    author: str
+    nsects: int
+    histogram: Union[Dict[SectionType, int], None] = None
+
+
+def peek_header(file: Union[str, BinaryIO], histogram: bool = False) -> FPFFHeader:
+    """Reads FPFF header without reading any sections.
+
+    Args:
+        file (Union[str, BinaryIO]): Path to FPFF or FPFF input byte stream.
+        histogram (bool): Also count sections of each type by seeking over
+            section payloads. Stream must be seekable. Defaults to False.
+
+    Raises:
+        ValueError: Magic did not match FPFF magic.
+        ValueError: Unsupported version. Only version 1 is supported.
+        ValueError: Section length must be greater than 0.
+        ValueError: Improper section length.
+        ValueError: File contained an unsupported type.
+        ValueError: Section extends past end of file.
+
+    Returns:
+        FPFFHeader: FPFF header.
+
+    Example:
+        >>> header = peek_header('./input.fpff', histogram=True)
+        >>> header.histogram[SectionType.PNG]
+    """
+
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return peek_header(f, histogram)
+
+    header = FPFFHeader(*_read_header(file))
+    if not histogram:
+        return header
+
+    offset = file.tell()
+    size = file.seek(0, os.SEEK_END)
+    file.seek(offset)
+
+    counts = {stype: 0 for stype in SectionType}
+    for _ in range(header.nsects):
+        data = file.read(8)
+        if len(data) != 8:
+            raise ValueError("Section extends past end of file.")
+        stype, slen = _SECTION_HEADER.unpack(data)
+        counts[_check_section(stype, slen)] += 1
+
+        offset += 8 + slen
+        if offset > size:
+            raise ValueError("Section extends past end of file.")
+        file.seek(offset)
+
+    return header._replace(histogram=counts)
+
+
+def copy_sections(fpff: FPFF, writer: FPFFWriter,
+                  selection: Union[Iterable[int], Callable[[int, SectionType], bool]]) -> List[int]:
+    """Copies sections from FPFF to writer without decoding them.
+
+    Unmodified sections of an FPFF from :meth:`FPFF.open` are copied from the
+    source file in the kernel where possible. References are rebased to the
+    positions of their targets in the writer, so every referenced section
+    must be copied in the same call.
+
+    Args:
+        fpff (FPFF): Source FPFF.
+        writer (FPFFWriter): Destination writer.
+        selection (Union[Iterable[int], Callable[[int, SectionType], bool]]): Indices
+            of sections to copy in order, or predicate taking section index and
+            type that selects sections to copy.
+
+    Raises:
+        IndexError: Section index out of range.
+        ValueError: Reference target was not copied.
+
+    Returns:
+        List[int]: Indices of copied sections in the source FPFF.
+
+    Example:
+        >>> with FPFF.open('./input.fpff') as fpff, FPFFWriter('./output.fpff') as writer:
+        >>>     copy_sections(fpff, writer, lambda i, t: t != SectionType.PNG)
+    """
+
+    if callable(selection):
+        indices = [
+            i for i, section in enumerate(fpff.sections)
+            if selection(i, section.stype)
+        ]
+    else:
+        indices = list(selection)
+
+    # Map source positions to writer positions
+    positions = {}
+    for k, i in enumerate(indices):
+        if i < 0 or i >= fpff.nsects:
+            raise IndexError("Section index out of range.")
+        positions.setdefault(i, writer.nsects + k)
+
+    # Rebase references before writing anything
+    refs = {}
+    for i in indices:
+        section = fpff.sections[i]
+        if section.stype == SectionType.REF:
+            target = positions.get(section.value)
+            if target == None:
+                raise ValueError("Reference target was not copied.")
+            refs[i] = target
+
+    for i in indices:
+        if i in refs:
+            writer.append(SectionType.REF, refs[i])
+        else:
+            writer._copy_section(fpff, i)
+
+    return indices
+
+
+def extract(fpff: FPFF, roots: Iterable[int], output: Union[str, BinaryIO],
+            author: Union[str, None] = None,
+            timestamp: Union[int, None] = None) -> List[int]:
+    """Extracts sections and every section they reference into a new FPFF.
+
+    Only the extracted sections are visited, and only REF sections among
+    them are decoded. Extracted sections keep their relative order and
+    references are rebased to the new positions of their targets. Payloads
+    of unmodified sections of an FPFF from :meth:`FPFF.open` are copied from
+    the source file in the kernel where possible.
+
+    Args:
+        fpff (FPFF): Source FPFF.
+        roots (Iterable[int]): Indices of sections to extract.
+        output (Union[str, BinaryIO]): Path to FPFF or seekable FPFF output byte stream.
+        author (str): Author name of the output. Defaults to the author of the source.
+        timestamp (int): UNIX timestamp of the output. Defaults to the timestamp of the source.
+
+    Raises:
+        IndexError: Section index out of range.
+        ValueError: Reference value is out of bounds.
+
+    Returns:
+        List[int]: Indices of extracted sections in the source FPFF, in
+            output order.
+
+    Example:
+        >>> with FPFF.open('./input.fpff') as fpff:
+        >>>     extract(fpff, [42], './section-42.fpff')
+    """
+
+    # Walk references from the roots
+    closure = set()
+    pending = []
+    for i in roots:
+        if i < 0 or i >= fpff.nsects:
+            raise IndexError("Section index out of range.")
+        pending.append(i)
+    while pending:
+        i = pending.pop()
+        if i in closure:
+            continue
+        closure.add(i)
+        section = fpff.sections[i]
+        if section.stype == SectionType.REF:
+            target = section.value
+            if type(target) != int or target < 0 or target >= fpff.nsects:
+                raise ValueError("Reference value is out of bounds.")
+            pending.append(target)
+
+    if author == None:
+        author = fpff.author
+    if timestamp == None:
+        timestamp = fpff.timestamp
+
+    with FPFFWriter(output, author, timestamp) as writer:
+        return copy_sections(fpff, writer, sorted(closure))
+
+
+def merge(inputs: Iterable[Union[str, BinaryIO]], output: Union[str, BinaryIO],
+          author: str = '', timestamp: Union[int, None] = None) -> int:
+    """Concatenates FPFFs into one FPFF.
+
+    Inputs are streamed one section at a time and section payloads are
+    copied in the kernel where possible, so memory use does not grow with
+    the number or size of inputs. References are rebased by the position of
+    the first section of their input in the output.
+
+    Args:
+        inputs (Iterable[Union[str, BinaryIO]]): Paths to FPFFs or seekable FPFF input byte streams.
+        output (Union[str, BinaryIO]): Path to FPFF or seekable FPFF output byte stream.
+        author (str): Author name of the output. Defaults to ''.
+        timestamp (int): UNIX timestamp of the output. Defaults to now.
+
+    Raises:
+        ValueError: Magic did not match FPFF magic.
+        ValueError: Unsupported version. Only version 1 is supported.
+        ValueError: Section length must be greater than 0.
+        ValueError: Improper section length.
+        ValueError: Reference value is out of bounds.
+        ValueError: File contained an unsupported type.
+        ValueError: Section extends past end of file.
+
+    Returns:
+        int: Number of sections in the output.
+
+    Example:
+        >>> merge(['./a.fpff', './b.fpff'], './merged.fpff')
+    """
+
+    with FPFFWriter(output, author, timestamp) as writer:
+        for file in inputs:
+            owned = isinstance(file, (str, os.PathLike))
+            if owned:
+                file = open(file, 'rb')
+
+            try:
+                _, _, _, nsects = _read_header(file)
+                source = _Source(file, nsects=nsects)
+                base = writer.nsects
+
+                for section in _walk_sections(source, file.tell(), nsects):
+                    if section.stype == SectionType.REF:
+                        writer.append(SectionType.REF, base + section.value)
+                    else:
+                        writer._copy_source(section)
+            finally:
+                if owned:
+                    file.close()
+
+        return writer.nsects
+
+
+def split(file: Union[str, BinaryIO], output_path: str,
+          max_bytes: Union[int, None] = None,
+          max_sections: Union[int, None] = None,
+          external_refs: str = 'flag') -> Dict[str, Any]:
+    """Splits FPFF into shards.
+
+    Sections are streamed into shards named ``shard-<n>.fpff`` in the output
+    directory, each holding at most ``max_sections`` sections and at most
+    ``max_bytes`` bytes. A section larger than ``max_bytes`` gets a shard of
+    its own. Section payloads are copied in the kernel where possible.
+
+    References to a section in the same shard are rebased to the shard.
+    References to a section in another shard cannot be kept as REF sections.
+    With ``external_refs='flag'`` each is written as a WORDS placeholder
+    section holding its global target as one little-endian word, the same
+    size as the REF section, and the global target is listed under
+    ``external_refs`` in the manifest. With ``external_refs='raise'`` the
+    split fails before any shard is written.
+
+    The manifest is written to ``manifest.json`` in the output directory.
+
+    Args:
+        file (Union[str, BinaryIO]): Path to FPFF or seekable FPFF input byte stream.
+        output_path (str): Path to output directory. Created if missing.
+        max_bytes (int): Maximum shard size in bytes. Defaults to no limit.
+        max_sections (int): Maximum number of sections per shard. Defaults to no limit.
+        external_refs (str): What to do with references to a section in
+            another shard, 'flag' or 'raise'. Defaults to 'flag'.
+
+    Raises:
+        ValueError: External refs must be 'flag' or 'raise'.
+        ValueError: Reference crosses shards. Raised if ``external_refs`` is 'raise'.
+        ValueError: Magic did not match FPFF magic.
+        ValueError: Unsupported version. Only version 1 is supported.
+        ValueError: Section length must be greater than 0.
+        ValueError: Improper section length.
+        ValueError: Reference value is out of bounds.
+        ValueError: File contained an unsupported type.
+        ValueError: Section extends past end of file.
+
+    Returns:
+        Dict[str, Any]: Manifest with shard file names under ``shards``,
+            ``[shard, local index]`` of each global section index under
+            ``sections`` and global targets of cross-shard references by
+            global index of their placeholder section under ``external_refs``.
+
+    Example:
+        >>> manifest = split('./input.fpff', './shards', max_bytes=1 << 30)
+    """
+
+    if external_refs not in ('flag', 'raise'):
+        raise ValueError("External refs must be 'flag' or 'raise'.")
+
+    owned = isinstance(file, (str, os.PathLike))
+    if owned:
+        file = open(file, 'rb')
+
+    try:
+        _, timestamp, author, nsects = _read_header(file)
+        source = _Source(file, nsects=nsects)
+        start = file.tell()
+
+        # Plan shards from section headers
+        shards = array('I')
+        positions = array('I')
+        shard = 0
+        count = 0
+        size = _HEADER.size
+        refs = {}
+        for i, section in enumerate(_walk_sections(source, start, nsects)):
+            if section.stype == SectionType.REF:
+                refs[i] = section.value
+            section_size = section.length + 8
+            if count > 0 and (
+                (max_sections != None and count >= max_sections)
+                or (max_bytes != None and size + section_size > max_bytes)
+            ):
+                shard += 1
+                count = 0
+                size = _HEADER.size
+            shards.append(shard)
+            positions.append(count)
+            count += 1
+            size += section_size
+
+        crossing = {
+            str(i): ref for i, ref in refs.items() if shards[ref] != shards[i]
+        }
+        if crossing and external_refs == 'raise':
+            raise ValueError("Reference crosses shards.")
+
+        # Write shards
+        os.makedirs(output_path, exist_ok=True)
+        names = [f'shard-{k}.fpff' for k in range(shard + 1)]
+        sections = _walk_sections(source, start, nsects)
+        i = 0
+        for k, name in enumerate(names):
+            with FPFFWriter(os.path.join(output_path, name), author, timestamp) as writer:
+                while i < nsects and shards[i] == k:
+                    section = next(sections)
+                    if section.stype == SectionType.REF:
+                        ref = refs[i]
+                        if shards[ref] == k:
+                            writer.append(SectionType.REF, positions[ref])
+                        else:
+                            writer.append(
+                                SectionType.WORDS, Words(ref.to_bytes(4, 'little'))
+                            )
+                    else:
+                        writer._copy_source(section)
+                    i += 1
+    finally:
+        if owned:
+            file.close()
+
+    manifest = {
+        'shards': names,
+        'sections': [[shards[i], positions[i]] for i in range(nsects)],
+        'external_refs': crossing,
+    }
+    with open(os.path.join(output_path, 'manifest.json'), 'w', encoding='utf8') as f:
+        json.dump(manifest, f)
+
+    return manifest
+
+
+class FPFFIndexEntry(NamedTuple):
+    """Section record of a sidecar index returned by :func:`read_index`.
+
+    Attributes:
+        stype (SectionType): Section type.
+        offset (int): Offset of section payload in the FPFF.
+        length (int): Length of section payload.
+        digest (bytes): 16-byte BLAKE2b digest of section payload.
+    """
+
+    stype: SectionType
+    offset: int
+    length: int
+    digest: bytes
+
+
+def write_index(path: str) -> str:
+    """Writes sidecar index for FPFF.
+
+    The index is written next to the FPFF with a ``.fpffidx`` suffix and
+    holds the type, payload offset, payload length and payload digest of
+    every section, along with the size and modification time of the FPFF.
+    :meth:`FPFF.open` loads the section table from the index instead of
+    scanning the FPFF for as long as the size and modification time match.
+
+    Args:
+        path (str): Path to FPFF.
+
+    Raises:
+        ValueError: Magic did not match FPFF magic.
+        ValueError: Unsupported version. Only version 1 is supported.
+        ValueError: Section length must be greater than 0.
+        ValueError: Improper section length.
+        ValueError: File contained an unsupported type.
+        ValueError: Section extends past end of file.
+
+    Returns:
+        str: Path to sidecar index.
+
+    Example:
+        >>> write_index('./input.fpff')
+    """
+
+    index_path = os.fspath(path) + _INDEX_SUFFIX
+    tmp_path = index_path + '.tmp'
+
+    with open(path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        _, _, _, nsects = _read_header(file)
+        source = _Source(file)
+
+        with open(tmp_path, 'wb') as f:
+            f.write(_INDEX_HEADER.pack(
+                _INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, nsects
+            ))
+            for section in _walk_sections(source, file.tell(), nsects):
+                h = hashlib.blake2b(digest_size=16)
+                for chunk in _iter_range(source, section.offset, section.length):
+                    h.update(chunk)
+                f.write(_INDEX_ENTRY.pack(
+                    section.stype, section.offset, section.length, h.digest()
+                ))
+
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def read_index(path: str) -> Union[List[FPFFIndexEntry], None]:
+    """Reads sidecar index for FPFF.
+
+    Args:
+        path (str): Path to FPFF, not to the index.
+
+    Returns:
+        Union[List[FPFFIndexEntry], None]: Section records, or None if there
+            is no index or it is stale or corrupt.
+
+    Example:
+        >>> entries = read_index('./input.fpff')
+    """
+
+    index_path = os.fspath(path) + _INDEX_SUFFIX
+
+    try:
+        stat = os.stat(path)
+        with open(index_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    if len(data) < _INDEX_HEADER.size:
+        return None
+    magic, size, mtime_ns, nsects = _INDEX_HEADER.unpack_from(data)
+    if magic != _INDEX_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+        return None
+    if len(data) != _INDEX_HEADER.size + nsects * _INDEX_ENTRY.size:
+        return None
+
+    # The index is only a cache, so anything that does not describe a
+    # valid section table of the FPFF is treated as missing
+    entries = []
+    expected = _HEADER.size + _SECTION_HEADER.size
+    for stype, offset, length, digest \
+            in _INDEX_ENTRY.iter_unpack(memoryview(data)[_INDEX_HEADER.size:]):
+        try:
+            stype = _check_section(stype, length)
+        except ValueError:
+            return None
+        if offset != expected or offset + length > size:
+            return None
+        entries.append(FPFFIndexEntry(stype, offset, length, digest))
+        expected = offset + length + _SECTION_HEADER.size
+
+    return entries
+
+
+def _read_path(path: str, lazy: bool, as_array: bool) -> Any:
+    """Reads FPFF at path in a worker process.
+
+    Args:
+        path (str): Path to FPFF.
+        lazy (bool): Only scan section headers.
+        as_array (bool): Decode doubles to arrays instead of lists.
+
+    Returns:
+        Any: Decoded FPFF, or if lazy, the section table packed as an
+            ``array('Q')`` of type, offset and length triples.
+    """
+
+    if not lazy:
+        with open(path, 'rb') as f:
+            return FPFF(f, as_array=as_array)
+
+    with open(path, 'rb') as f:
+        _, _, _, nsects = _read_header(f)
+        source = _Source(f)
+        table = array('Q')
+        for p in _scan_sections(source, f.tell(), nsects):
+            table.extend((p.stype, p.offset, p.length))
+        return table
+
+
+def read_many(paths: Iterable[str], workers: Union[int, None] = None,
+              lazy: bool = False, processes: bool = True,
+              as_array: bool = False) -> Iterator[Tuple[str, FPFF]]:
+    """Reads many FPFFs in parallel.
+
+    With processes, lazy FPFFs are scanned in the workers and only the
+    section table is sent back, so the parent reopens each file without
+    scanning it again. Decoded FPFFs are pickled back to the parent.
+
+    Args:
+        paths (Iterable[str]): Paths to FPFFs.
+        workers (int): Maximum number of workers. Defaults to the executor default.
+        lazy (bool): Open FPFFs lazily as with :meth:`FPFF.open` instead of
+            decoding every section. Defaults to False.
+        processes (bool): Use a process pool instead of a thread pool. Defaults to True.
+        as_array (bool): Decode doubles to arrays instead of lists. Defaults to False.
+
+    Raises:
+        OSError: FPFF could not be opened, such as ``FileNotFoundError`` for a
+            missing path. Raised when its result is reached.
+        ValueError: FPFF is not valid. Raised when its result is reached.
+
+    Yields:
+        Tuple[str, FPFF]: Path and FPFF, in order of completion. Lazy FPFFs
+            should be closed by the caller. Lazy FPFFs not yet yielded are
+            closed if iteration stops early or raises.
+
+    Example:
+        >>> for path, fpff in read_many(paths, workers=32):
+        >>>     print(path, fpff.nsects)
+    """
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    with executor:
+        if processes:
+            futures = {
+                executor.submit(_read_path, path, lazy, as_array): path
+                for path in paths
+            }
+        elif lazy:
+            futures = {
+                executor.submit(FPFF.open, path, as_array=as_array): path
+                for path in paths
+            }
+        else:
+            futures = {
+                executor.submit(_read_path, path, False, as_array): path
+                for path in paths
+            }
+
+        reached = set()
+        try:
+            for future in as_completed(futures):
+                reached.add(future)
+                path = futures[future]
+                fpff = future.result()
+
+                if processes and lazy:
+                    table = fpff
+                    sections = [
+                        Section._from_source(SectionType(table[j]), table[j+1], table[j+2])
+                        for j in range(0, len(table), 3)
+                    ]
+                    fpff = FPFF._open(path, as_array=as_array, sections=sections)
+
+                yield path, fpff
+        finally:
+            if lazy and not processes:
+                # Close FPFFs opened by workers that will not be yielded
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
+                for future in futures.keys() - reached:
+                    if not future.cancelled() and future.exception() == None:
+                        future.result().close()
+
+
+def iter_sections(file: BinaryIO, as_array: bool = False) -> Iterator[Tuple[int, SectionType, Any]]:
+    """Reads FPFF sections one at a time from byte stream.
+
+    Only one section is held in memory at a time, so FPFFs larger than
+    memory can be processed. Stream does not need to be seekable.
+
+    Args:
+        file (BinaryIO): FPFF input byte stream.
+        as_array (bool): Decode doubles to arrays instead of lists. See :meth:`FPFF.read`.
+            Defaults to False.
+
+    Raises:
+        ValueError: Magic did not match FPFF magic.
+        ValueError: Unsupported version. Only version 1 is supported.
+        ValueError: Section length must be greater than 0.
+        ValueError: Improper section length.
+        ValueError: Reference value is out of bounds.
+        ValueError: File contained an unsupported type.
+        ValueError: Section extends past end of file.
+
+    Yields:
+        Tuple[int, SectionType, Any]: Section index, type and value.
+
+    Example:
+        >>> with open('./input.fpff', 'rb') as f:
+        >>>     for i, stype, svalue in iter_sections(f):
+        >>>         print(i, stype, svalue)
+    """
+
+    _, _, _, nsects = _read_header(file)
+
+    for i, (stype, svalue) in enumerate(_iter_payloads(file, nsects)):
+        yield i, stype, _decode_section(stype, svalue, nsects, as_array)
+
+
+async def aiter_sections(reader: asyncio.StreamReader,
+                         as_array: bool = False) -> AsyncIterator[Tuple[int, SectionType, Any]]:
+    """Reads FPFF sections one at a time from asyncio stream.
+
+    Only one section is held in memory at a time and the event loop is free
+    while waiting for data, so many streams can be read concurrently.
+
+    Args:
+        reader (asyncio.StreamReader): FPFF input stream.
+        as_array (bool): Decode doubles to arrays instead of lists. See :meth:`FPFF.read`.
+            Defaults to False.
+
+    Raises:
+        ValueError: Magic did not match FPFF magic.
+        ValueError: Unsupported version. Only version 1 is supported.
+        ValueError: Section length must be greater than 0.
+        ValueError: Improper section length.
+        ValueError: Reference value is out of bounds.
+        ValueError: File contained an unsupported type.
+        ValueError: Section extends past end of file.
+
+    Yields:
+        Tuple[int, SectionType, Any]: Section index, type and value.
+
+    Example:
+        >>> async for i, stype, svalue in aiter_sections(reader):
+        >>>     print(i, stype, svalue)
+    """
+
+    _, _, _, nsects = await _aread_header(reader)
+
+    i = 0
+    async for stype, svalue in _aiter_payloads(reader, nsects):
+        yield i, stype, _decode_section(stype, svalue, nsects, as_array)
+        i += 1
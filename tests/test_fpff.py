@@ -1,8 +1,16 @@
 import unittest
+import asyncio
+import io
 import os
 import tempfile
 import shutil
-from py_fpff import FPFF, SectionType
+import random
+import socket
+import gc
+import warnings
+from array import array
+from py_fpff import AsyncFPFFWriter, FPFF, FPFFWriter, Section, SectionType, Words, \
+    aiter_sections, copy_sections, extract, iter_sections, merge, peek_header, read_index, read_many, split, write_index
 
 
 class FPFFTest(unittest.TestCase):
@@ -126,6 +134,800 @@ class FPFFTest(unittest.TestCase):
         for v1, v2 in zip(vals, fpff.svalues):
             assert v1 == v2
 
+    def test_open_lazy(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+
+        fpff_1 = FPFF(author='jasmaa')
+        fpff_1.append(SectionType.ASCII, 'Hello, world!')
+        fpff_1.append(SectionType.WORDS, [b'\x00\x01\x02\x03'])
+        fpff_1.append(SectionType.REF, 0)
+        with open('./tests/test_png.png', 'rb') as in_f:
+            fpff_1.append(SectionType.PNG, in_f.read())
+        with open(file_path, 'wb') as f:
+            fpff_1.write(f)
+
+        with FPFF.open(file_path) as fpff_2:
+            assert fpff_2.author == 'jasmaa'
+            assert fpff_2.nsects == 4
+            assert fpff_2.stypes == fpff_1.stypes
+            assert fpff_2[2] == 0
+            assert fpff_2.svalues[3] == fpff_1.svalues[3]
+            assert list(fpff_2.svalues) == fpff_1.svalues
+
+        # Undecoded sections need the source file
+        fpff_3 = FPFF.open(file_path)
+        fpff_3.close()
+        with self.assertRaises(ValueError):
+            fpff_3[0]
+
+    def test_open_mmap(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+
+        fpff_1 = FPFF(author='jasmaa')
+        fpff_1.append(SectionType.UTF8, 'おはよう世界')
+        fpff_1.append(SectionType.DOUBLES, [0.5, -2.25])
+        with open('./tests/test_gif89.gif', 'rb') as in_f:
+            fpff_1.append(SectionType.GIF89, in_f.read())
+        with open(file_path, 'wb') as f:
+            fpff_1.write(f)
+
+        with FPFF.open(file_path, use_mmap=True) as fpff_2:
+            payload = fpff_2.raw(2)
+            assert isinstance(payload, memoryview)
+            assert payload == fpff_1.svalues[2][6:]
+            assert fpff_2.raw(0) == 'おはよう世界'.encode('utf8')
+            assert list(fpff_2.svalues) == fpff_1.svalues
+            del payload
+
+    def test_doubles_array(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+
+        values = [-1, 0, 0.3, -0.53, 1e300]
+        fpff_1 = FPFF()
+        fpff_1.append(SectionType.DOUBLES, values)
+        fpff_1.append(SectionType.DOUBLES, array('d', values))
+        with open(file_path, 'wb') as f:
+            fpff_1.write(f)
+
+        with open(file_path, 'rb') as f:
+            fpff_2 = FPFF(f)
+            assert type(fpff_2.svalues[0]) == list
+            assert fpff_2.svalues[0] == values
+            assert fpff_2.svalues[1] == values
+
+        with open(file_path, 'rb') as f:
+            fpff_3 = FPFF(f, as_array=True)
+            assert type(fpff_3.svalues[0]) != list
+            assert list(fpff_3.svalues[0]) == values
+
+    def test_words(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+
+        words = Words(b'\x00\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0A\x0B')
+        assert len(words) == 3
+        assert words[1] == b'\x04\x05\x06\x07'
+        assert words[-1] == b'\x08\x09\x0A\x0B'
+        assert words[1:] == [b'\x04\x05\x06\x07', b'\x08\x09\x0A\x0B']
+        with self.assertRaises(ValueError):
+            Words(b'\x00\x01\x02')
+
+        fpff_1 = FPFF()
+        fpff_1.append(SectionType.WORDS, words)
+        fpff_1.append(SectionType.DWORDS, Words(words.tobytes()[:8], 8))
+        with open(file_path, 'wb') as f:
+            fpff_1.write(f)
+
+        with open(file_path, 'rb') as f:
+            fpff_2 = FPFF(f)
+            assert type(fpff_2.svalues[0]) == Words
+            assert fpff_2.svalues[0] == words
+            assert fpff_2.svalues[1] == [b'\x00\x01\x02\x03\x04\x05\x06\x07']
+
+    def test_write_bad_words(self):
+        fpff = FPFF()
+        fpff.append(SectionType.WORDS, [b'\x00\x00\x00\x00', b'\x00\x00\x00'])
+        with self.assertRaises(ValueError):
+            fpff.write(io.BytesIO())
+
+        fpff = FPFF()
+        fpff.append(SectionType.DWORDS, [b'\x00' * 8, b'\x00' * 4])
+        with self.assertRaises(ValueError):
+            fpff.write(io.BytesIO())
+
+    def test_iter_sections(self):
+        fpff = FPFF(author='jasmaa')
+        fpff.append(SectionType.ASCII, 'Hello, world!')
+        fpff.append(SectionType.COORD, (1.5, -2.5))
+        fpff.append(SectionType.REF, 0)
+        buf = io.BytesIO()
+        fpff.write(buf)
+        buf.seek(0)
+
+        sections = list(iter_sections(buf))
+        assert sections == [
+            (0, SectionType.ASCII, 'Hello, world!'),
+            (1, SectionType.COORD, (1.5, -2.5)),
+            (2, SectionType.REF, 0),
+        ]
+
+        # Stream cut inside the last payload
+        data = buf.getvalue()
+        with self.assertRaises(ValueError):
+            list(iter_sections(io.BytesIO(data[:-1])))
+        with self.assertRaises(ValueError):
+            FPFF(io.BytesIO(data[:-1]))
+
+    def test_writer(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+
+        with FPFFWriter(file_path, author='jasmaa', timestamp=1234) as writer:
+            writer.append(SectionType.ASCII, 'Hello, world!')
+            writer.append(SectionType.DOUBLES, [0.5, 1.5])
+            writer.append(SectionType.REF, 0)
+            with self.assertRaises(TypeError):
+                writer.append(SectionType.REF, 'a')
+            assert writer.nsects == 3
+
+        with open(file_path, 'rb') as f:
+            fpff = FPFF(f)
+            assert fpff.author == 'jasmaa'
+            assert fpff.timestamp == 1234
+            assert fpff.nsects == 3
+            assert fpff.svalues == ['Hello, world!', [0.5, 1.5], 0]
+
+    def test_peek_header(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+
+        with FPFFWriter(file_path, author='jasmaa', timestamp=1234) as writer:
+            writer.append(SectionType.ASCII, 'a')
+            writer.append(SectionType.ASCII, 'b')
+            writer.append(SectionType.REF, 0)
+
+        header = peek_header(file_path)
+        assert header.version == 1
+        assert header.timestamp == 1234
+        assert header.author == 'jasmaa'
+        assert header.nsects == 3
+        assert header.histogram == None
+
+        header = peek_header(file_path, histogram=True)
+        assert header.histogram[SectionType.ASCII] == 2
+        assert header.histogram[SectionType.REF] == 1
+        assert header.histogram[SectionType.PNG] == 0
+
+        with self.assertRaises(ValueError):
+            peek_header(io.BytesIO(b'not an fpff'))
+
+        # Last section payload is truncated
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        with self.assertRaises(ValueError):
+            peek_header(io.BytesIO(data[:-1]), histogram=True)
+
+    def test_read_many(self):
+        paths = []
+        for i in range(4):
+            file_path = os.path.join(self.test_dir, f'out-{i}.fpff')
+            with FPFFWriter(file_path) as writer:
+                writer.append(SectionType.ASCII, str(i))
+                writer.append(SectionType.WORDS, Words(bytes(8)))
+            paths.append(file_path)
+
+        for lazy in [False, True]:
+            for processes in [False, True]:
+                results = dict(read_many(
+                    paths, workers=2, lazy=lazy, processes=processes
+                ))
+                assert sorted(results) == paths
+                for i, file_path in enumerate(paths):
+                    with results[file_path] as fpff:
+                        assert fpff.svalues == [str(i), [bytes(4), bytes(4)]]
+
+        # Lazy FPFFs not yielded are closed when a path fails
+        missing = os.path.join(self.test_dir, 'missing.fpff')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', ResourceWarning)
+            with self.assertRaises(FileNotFoundError):
+                for _, fpff in read_many(
+                    paths + [missing] + paths, workers=2, lazy=True, processes=False
+                ):
+                    fpff.close()
+            gc.collect()
+        assert not [w for w in caught if issubclass(w.category, ResourceWarning)]
+
+    def test_export_workers(self):
+        fpff = FPFF()
+        for i in range(20):
+            fpff.append(SectionType.ASCII, f'section {i}')
+        with open('./tests/test_png.png', 'rb') as in_f:
+            png = in_f.read()
+            fpff.append(SectionType.PNG, png)
+
+        output_path = os.path.join(self.test_dir, 'exported')
+        fpff.export(output_path, workers=4)
+
+        assert len(os.listdir(output_path)) == 21
+        with open(os.path.join(output_path, 'section-7.txt'), encoding='utf8') as f:
+            assert f.read() == 'section 7'
+        with open(os.path.join(output_path, 'section-20.png'), 'rb') as f:
+            assert f.read() == png
+
+    def test_export_incremental(self):
+        output_path = os.path.join(self.test_dir, 'exported')
+
+        fpff = FPFF()
+        fpff.append(SectionType.ASCII, 'a')
+        fpff.append(SectionType.ASCII, 'b')
+        fpff.append(SectionType.ASCII, 'c')
+        fpff.export(output_path, incremental=True)
+
+        # Mark files to see which ones get rewritten
+        for i in range(3):
+            os.utime(os.path.join(output_path, f'section-{i}.txt'), (0, 0))
+
+        fpff.svalues[1] = 'B'
+        fpff.remove(2)
+        fpff.export(output_path, workers=2, incremental=True)
+
+        file_names = sorted(os.listdir(output_path))
+        assert file_names == ['.fpff-manifest.json', 'section-0.txt', 'section-1.txt']
+        assert os.path.getmtime(os.path.join(output_path, 'section-0.txt')) == 0
+        assert os.path.getmtime(os.path.join(output_path, 'section-1.txt')) != 0
+        with open(os.path.join(output_path, 'section-1.txt'), encoding='utf8') as f:
+            assert f.read() == 'B'
+
+        # Section files from a plain export are not in a manifest
+        fpff.append(SectionType.ASCII, 'd')
+        fpff.append(SectionType.ASCII, 'e')
+        fpff.export(output_path)
+        fpff.remove(3)
+        fpff.remove(2)
+        fpff.export(output_path, incremental=True)
+        file_names = sorted(os.listdir(output_path))
+        assert file_names == ['.fpff-manifest.json', 'section-0.txt', 'section-1.txt']
+
+    def test_export_media_copy(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+        output_path = os.path.join(self.test_dir, 'exported')
+
+        fpff_1 = FPFF()
+        with open('./tests/test_png.png', 'rb') as in_f:
+            png = in_f.read()
+            fpff_1.append(SectionType.PNG, png)
+        with open('./tests/test_gif87.gif', 'rb') as in_f:
+            gif = in_f.read()
+            fpff_1.append(SectionType.GIF87, gif)
+        with open(file_path, 'wb') as f:
+            fpff_1.write(f)
+
+        # Copied from file, then from a stream without a file descriptor
+        with open(file_path, 'rb') as f:
+            buf = io.BytesIO(f.read())
+        for source in [file_path, buf]:
+            with FPFF.open(source) as fpff_2:
+                fpff_2.export(output_path, incremental=True)
+                assert not fpff_2.sections[0].modified
+
+            with open(os.path.join(output_path, 'section-0.png'), 'rb') as f:
+                assert f.read() == png
+            with open(os.path.join(output_path, 'section-1.gif'), 'rb') as f:
+                assert f.read() == gif
+
+    def test_write_passthrough(self):
+        file_path_1 = os.path.join(self.test_dir, 'out-1.fpff')
+        file_path_2 = os.path.join(self.test_dir, 'out-2.fpff')
+
+        with FPFFWriter(file_path_1, author='jasmaa') as writer:
+            writer.append(SectionType.ASCII, 'a')
+            writer.append(SectionType.DOUBLES, [0.5, 1.5])
+            writer.append(SectionType.UTF8, 'b')
+            writer.append(SectionType.REF, 0)
+            writer.append(SectionType.WORDS, [b'\x00\x01\x02\x03'])
+
+        with FPFF.open(file_path_1) as fpff:
+            assert fpff[0] == 'a'
+            fpff.svalues[1].append(2.5)
+            fpff.svalues[2] = 'c'
+            fpff.insert(4, SectionType.ASCII, 'd')
+            assert not fpff.sections[0].modified
+            assert fpff.sections[1].modified
+            assert fpff.sections[2].modified
+            assert not fpff.sections[3].modified
+            with open(file_path_2, 'wb') as f:
+                fpff.write(f)
+
+        with open(file_path_2, 'rb') as f:
+            fpff = FPFF(f)
+            assert fpff.svalues == [
+                'a', [0.5, 1.5, 2.5], 'c', 0, 'd', [b'\x00\x01\x02\x03']
+            ]
+
+        # Output that cannot be seeked, such as a pipe
+        read_fd, write_fd = os.pipe()
+        with open(read_fd, 'rb') as read_f:
+            with FPFF.open(file_path_1) as fpff, open(write_fd, 'wb') as write_f:
+                fpff.write(write_f)
+            assert FPFF(read_f).svalues == [
+                'a', [0.5, 1.5], 'b', 0, [b'\x00\x01\x02\x03']
+            ]
+
+    def test_copy_sections(self):
+        file_path_1 = os.path.join(self.test_dir, 'out-1.fpff')
+        file_path_2 = os.path.join(self.test_dir, 'out-2.fpff')
+
+        with FPFFWriter(file_path_1) as writer:
+            writer.append(SectionType.ASCII, 'a')
+            writer.append(SectionType.UTF8, 'b')
+            writer.append(SectionType.REF, 3)
+            writer.append(SectionType.ASCII, 'c')
+
+        with FPFF.open(file_path_1) as fpff, FPFFWriter(file_path_2) as writer:
+            writer.append(SectionType.ASCII, 'first')
+            with self.assertRaises(ValueError):
+                copy_sections(fpff, writer, [2])
+            copied = copy_sections(
+                fpff, writer, lambda i, t: t != SectionType.UTF8
+            )
+            assert copied == [0, 2, 3]
+            copy_sections(fpff, writer, [1])
+
+        with open(file_path_2, 'rb') as f:
+            fpff = FPFF(f)
+            assert fpff.svalues == ['first', 'a', 3, 'c', 'b']
+
+    def test_merge(self):
+        paths = []
+        for i in range(3):
+            file_path = os.path.join(self.test_dir, f'out-{i}.fpff')
+            with FPFFWriter(file_path) as writer:
+                writer.append(SectionType.ASCII, str(i))
+                writer.append(SectionType.REF, 0)
+            paths.append(file_path)
+
+        output = io.BytesIO()
+        assert merge(paths, output, author='jasmaa') == 6
+
+        output.seek(0)
+        fpff = FPFF(output)
+        assert fpff.author == 'jasmaa'
+        assert fpff.svalues == ['0', 0, '1', 2, '2', 4]
+
+    def test_split(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+        output_path = os.path.join(self.test_dir, 'shards')
+
+        with FPFFWriter(file_path, author='jasmaa') as writer:
+            for i in range(5):
+                writer.append(SectionType.ASCII, str(i))
+            writer.append(SectionType.REF, 4)
+            writer.append(SectionType.REF, 0)
+
+        manifest = split(file_path, output_path, max_sections=3)
+        assert manifest['shards'] == ['shard-0.fpff', 'shard-1.fpff', 'shard-2.fpff']
+        assert manifest['sections'][4] == [1, 1]
+        assert manifest['sections'][6] == [2, 0]
+        assert manifest['external_refs'] == {'6': 0}
+
+        with open(os.path.join(output_path, 'shard-1.fpff'), 'rb') as f:
+            fpff = FPFF(f)
+            assert fpff.author == 'jasmaa'
+            assert fpff.svalues == ['3', '4', 1]
+        with open(os.path.join(output_path, 'shard-2.fpff'), 'rb') as f:
+            fpff = FPFF(f)
+            assert fpff.stypes == [SectionType.WORDS]
+            assert fpff.svalues == [[(0).to_bytes(4, 'little')]]
+
+        # Each shard holds at least one section
+        manifest = split(file_path, output_path, max_bytes=1)
+        assert len(manifest['shards']) == 7
+
+        # Shards hold no references outside themselves
+        for max_sections in [2, 3, 7]:
+            manifest = split(file_path, output_path, max_sections=max_sections)
+            for name in manifest['shards']:
+                with FPFF.open(os.path.join(output_path, name)) as fpff:
+                    for i in range(fpff.nsects):
+                        fpff.resolve(i)
+                    extract(
+                        fpff, range(fpff.nsects),
+                        os.path.join(self.test_dir, 'extracted.fpff')
+                    )
+
+        with self.assertRaises(ValueError):
+            split(file_path, output_path, max_sections=3, external_refs='raise')
+        manifest = split(file_path, output_path, max_sections=7, external_refs='raise')
+        assert manifest['external_refs'] == {}
+
+    def test_index(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+
+        with FPFFWriter(file_path) as writer:
+            writer.append(SectionType.ASCII, 'a')
+            writer.append(SectionType.UTF8, 'b')
+
+        assert read_index(file_path) == None
+        index_path = write_index(file_path)
+        assert index_path == file_path + '.fpffidx'
+
+        entries = read_index(file_path)
+        assert [entry.stype for entry in entries] == [SectionType.ASCII, SectionType.UTF8]
+        assert entries[1].offset == 24 + 8 + 1 + 8
+        assert entries[0].digest != entries[1].digest
+
+        with FPFF.open(file_path) as fpff:
+            assert fpff.svalues == ['a', 'b']
+
+        # Corrupt index is ignored in favor of scanning
+        with open(index_path, 'rb') as f:
+            data = f.read()
+        for pos, value in [
+            (28, 99),                       # Unsupported type
+            (28 + 32 + 4, 24 + 8 + 1 + 9),  # Offset off by one
+            (28 + 32 + 12, 50),             # Length past end of file
+        ]:
+            corrupt = bytearray(data)
+            corrupt[pos] = value
+            with open(index_path, 'wb') as f:
+                f.write(corrupt)
+            assert read_index(file_path) == None
+            with FPFF.open(file_path) as fpff:
+                assert fpff.svalues == ['a', 'b']
+
+        # Index is stale once FPFF changes
+        with FPFFWriter(file_path) as writer:
+            writer.append(SectionType.ASCII, 'c')
+        os.utime(file_path, ns=(0, 0))
+        assert read_index(file_path) == None
+        with FPFF.open(file_path) as fpff:
+            assert fpff.svalues == ['c']
+
+    def test_splice(self):
+        fpff = FPFF()
+        vals = []
+        for i in range(3000):
+            fpff.append(SectionType.ASCII, str(i))
+            vals.append(str(i))
+
+        # Spans several blocks of the section table
+        for i in range(0, 3000, 7):
+            fpff.insert(i, SectionType.ASCII, str(-i))
+            vals.insert(i, str(-i))
+        for i in range(0, 2000, 5):
+            fpff.remove(i)
+            del vals[i]
+        fpff.splice(100, 1500, [(SectionType.ASCII, '7')] * 3)
+        vals[100:1600] = ['7'] * 3
+
+        assert fpff.nsects == len(vals)
+        assert list(fpff.svalues) == vals
+        assert fpff.svalues[-1] == vals[-1]
+        with self.assertRaises(TypeError):
+            fpff.splice(0, 0, [(SectionType.REF, 'a')])
+
+    def test_sections(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+
+        with FPFFWriter(file_path) as writer:
+            writer.append(SectionType.ASCII, 'a')
+            writer.append(SectionType.UTF8, 'b')
+
+        with FPFF.open(file_path) as fpff:
+            section = fpff.sections[0]
+            assert type(section) == Section
+            assert section.offset == 24 + 8
+            assert section.length == 1
+            assert bytes(section.raw()) == b'a'
+
+            # Views read and write through to sections
+            fpff.stypes[0] = SectionType.UTF8
+            assert section.value == 'a'
+            assert section.modified
+            fpff.svalues[1] = 'c'
+            assert fpff.sections[1].value == 'c'
+            assert fpff.stypes == [SectionType.UTF8, SectionType.UTF8]
+            with self.assertRaises(TypeError):
+                del fpff.svalues[0]
+            with self.assertRaises(TypeError):
+                fpff.stypes.append(SectionType.ASCII)
+
+            fpff.append(SectionType.REF, 0)
+            assert fpff.nsects == len(fpff.sections) == 3
+            assert fpff.sections[2].modified
+
+            # Assigned sections are copied into a table that splices
+            sections = list(fpff.sections)
+
+        other = FPFF()
+        other.sections = sections
+        other.splice(1, 1, [(SectionType.ASCII, 'd'), (SectionType.REF, 1)])
+        other.extend([(SectionType.ASCII, 'e')])
+        assert other.svalues == ['a', 'd', 1, 0, 'e']
+        assert other.referrers(1) == [2]
+        assert sections[1].value == 'c'
+
+    def test_extend(self):
+        fpff = FPFF()
+        fpff.append(SectionType.ASCII, 'a')
+        fpff.extend([(SectionType.REF, 0), (SectionType.COORD, (1.0, 2.0))])
+        fpff.extend_doubles([[0.5], array('d', [1.5, 2.5])])
+        assert fpff.stypes == [
+            SectionType.ASCII, SectionType.REF, SectionType.COORD,
+            SectionType.DOUBLES, SectionType.DOUBLES,
+        ]
+        assert fpff.nsects == 5
+
+        # Nothing is added if any value is invalid
+        with self.assertRaises(TypeError):
+            fpff.extend([(SectionType.REF, 0), (SectionType.REF, 'a')])
+        with self.assertRaises(TypeError):
+            fpff.extend_doubles([[0.5], 'a'])
+        assert fpff.nsects == 5
+
+        fpff.extend([(SectionType.REF, 'a')], validate=False)
+        assert fpff.svalues[5] == 'a'
+
+    def test_refs(self):
+        fpff = FPFF()
+        fpff.extend([
+            (SectionType.ASCII, 'a'), (SectionType.ASCII, 'b'),
+            (SectionType.REF, 1), (SectionType.REF, 2), (SectionType.REF, 0),
+        ])
+        fpff.insert(1, SectionType.ASCII, 'x')
+        assert fpff.svalues == ['a', 'x', 'b', 2, 3, 0]
+        assert fpff.referrers(2) == [3]
+
+        with self.assertRaises(ValueError):
+            fpff.remove(2)
+        fpff.remove(1)
+        assert fpff.svalues == ['a', 'b', 1, 2, 0]
+
+        # Removes b and the chain of references to it
+        fpff.remove(1, cascade=True)
+        assert fpff.svalues == ['a', 0]
+
+        fpff.splice(0, 0, [(SectionType.ASCII, 'c')])
+        assert fpff.svalues == ['c', 'a', 1]
+        with self.assertRaises(ValueError):
+            fpff.splice(1, 1)
+        fpff.svalues[2] = 0
+        assert fpff.referrers(0) == [2]
+        fpff.splice(1, 1)
+        assert fpff.svalues == ['c', 0]
+
+        # Matches remapping every reference by hand
+        rng = random.Random(0)
+        fpff = FPFF()
+        model = []
+        for _ in range(1000):
+            n = len(model)
+            i = rng.randrange(n + 1)
+            if n and rng.random() < 0.4:
+                i = rng.randrange(n)
+                refs = [j for j, (t, v) in enumerate(model) if t == SectionType.REF and v == i]
+                if any(j != i for j in refs):
+                    with self.assertRaises(ValueError):
+                        fpff.remove(i)
+                    continue
+                fpff.remove(i)
+                del model[i]
+                model = [
+                    (t, v - 1 if t == SectionType.REF and v > i else v)
+                    for t, v in model
+                ]
+            else:
+                model = [
+                    (t, v + 1 if t == SectionType.REF and v >= i else v)
+                    for t, v in model
+                ]
+                if n and rng.random() < 0.5:
+                    section = (SectionType.REF, rng.randrange(n + 1))
+                else:
+                    section = (SectionType.ASCII, str(i))
+                fpff.insert(i, *section)
+                model.insert(i, section)
+        assert list(zip(fpff.stypes, fpff.svalues)) == model
+
+    def test_refs_passthrough(self):
+        file_path_1 = os.path.join(self.test_dir, 'out-1.fpff')
+        file_path_2 = os.path.join(self.test_dir, 'out-2.fpff')
+
+        with FPFFWriter(file_path_1) as writer:
+            writer.append(SectionType.ASCII, 'a')
+            writer.append(SectionType.REF, 0)
+            writer.append(SectionType.ASCII, 'b')
+            writer.append(SectionType.REF, 2)
+
+        with FPFF.open(file_path_1) as fpff:
+            fpff.insert(2, SectionType.ASCII, 'c')
+            assert not fpff.sections[1].modified
+            assert fpff.sections[4].modified
+            with open(file_path_2, 'wb') as f:
+                fpff.write(f)
+
+        with open(file_path_2, 'rb') as f:
+            assert FPFF(f).svalues == ['a', 0, 'c', 'b', 3]
+
+    def test_find(self):
+        file_path = os.path.join(self.test_dir, 'out.fpff')
+
+        with FPFFWriter(file_path) as writer:
+            writer.append(SectionType.ASCII, 'a')
+            writer.append(SectionType.COORD, (1.0, 2.0))
+            writer.append(SectionType.ASCII, 'b')
+
+        # Indexed from section headers alone
+        fpff = FPFF.open(file_path)
+        fpff.close()
+        assert fpff.find(SectionType.ASCII) == (0, 2)
+        assert fpff.find(SectionType.PNG) == ()
+        assert fpff.find_first(SectionType.COORD) == 1
+        assert fpff.find_first(SectionType.PNG) == None
+
+        with open(file_path, 'rb') as f:
+            fpff = FPFF(f)
+        assert fpff.find(SectionType.ASCII) is fpff.find(SectionType.ASCII)
+
+        rng = random.Random(0)
+        stypes = [SectionType.ASCII, SectionType.UTF8, SectionType.REF]
+        for _ in range(500):
+            n = fpff.nsects
+            op = rng.random()
+            if op < 0.4:
+                fpff.insert(rng.randrange(n + 1), rng.choice(stypes[:2]), 'x')
+            elif op < 0.6 and n:
+                fpff.remove(rng.randrange(n))
+            elif op < 0.7 and n:
+                fpff.stypes[rng.randrange(n)] = rng.choice(stypes[:2])
+            elif op < 0.8:
+                i = rng.randrange(n + 1)
+                fpff.splice(i, rng.randrange(3), [(SectionType.UTF8, 'y')] * rng.randrange(3))
+            elif rng.random() < 0.5:
+                fpff.append(SectionType.REF, n)
+            else:
+                fpff.append(rng.choice(stypes[:2]), 'z')
+
+            stype = rng.choice(stypes)
+            expected = tuple(i for i, t in enumerate(fpff.stypes) if t == stype)
+            assert fpff.find(stype) == expected
+            assert fpff.find_first(stype) == (expected[0] if expected else None)
+
+        # Many front edits on a large FPFF are rebuilt, not replayed
+        fpff = FPFF()
+        fpff.extend([(SectionType.ASCII, 'a')] * 100000)
+        assert len(fpff.find(SectionType.ASCII)) == 100000
+        for _ in range(3000):
+            fpff.insert(0, SectionType.UTF8, 'b')
+        assert fpff.find(SectionType.ASCII) == tuple(range(3000, 103000))
+        assert fpff.find(SectionType.UTF8) == tuple(range(3000))
+
+    def test_resolve(self):
+        fpff = FPFF()
+        fpff.extend([
+            (SectionType.ASCII, 'a'), (SectionType.REF, 0),
+            (SectionType.REF, 1), (SectionType.REF, 2),
+        ])
+        assert fpff.resolve(0) == 0
+        assert fpff.resolve(3) == 0
+        assert fpff.resolve(-2) == 0
+
+        # Memo follows edits
+        fpff.insert(0, SectionType.ASCII, 'b')
+        assert fpff.resolve(4) == 1
+        fpff.svalues[2] = 0
+        assert fpff.resolve(4) == 0
+        fpff.append(SectionType.REF, 4)
+        assert fpff.resolve(5) == 0
+
+        fpff.extend([(SectionType.REF, 7), (SectionType.REF, 6)])
+        with self.assertRaises(ValueError):
+            fpff.resolve(6)
+        fpff.append(SectionType.REF, 9)
+        with self.assertRaises(ValueError):
+            fpff.resolve(8)
+        with self.assertRaises(IndexError):
+            fpff.resolve(9)
+
+        # Memo follows sections replaced at the tail
+        fpff = FPFF()
+        fpff.extend([(SectionType.ASCII, 'a'), (SectionType.REF, 0)])
+        assert fpff.resolve(1) == 0
+        fpff.splice(1, 1, [(SectionType.ASCII, 'b')])
+        assert fpff.resolve(1) == 1
+        fpff.splice(1, 1, [(SectionType.REF, 0)])
+        assert fpff.resolve(1) == 0
+        fpff.splice(1, 1, [(SectionType.ASCII, 'b'), (SectionType.ASCII, 'c')])
+        assert fpff.resolve(1) == 1
+
+    def test_extract(self):
+        file_path_1 = os.path.join(self.test_dir, 'out-1.fpff')
+        file_path_2 = os.path.join(self.test_dir, 'out-2.fpff')
+
+        with FPFFWriter(file_path_1, author='jasmaa') as writer:
+            writer.append(SectionType.ASCII, 'a')
+            writer.append(SectionType.ASCII, 'b')
+            writer.append(SectionType.COORD, (1.0, 2.0))
+            writer.append(SectionType.REF, 2)
+            writer.append(SectionType.ASCII, 'c')
+            writer.append(SectionType.REF, 3)
+            writer.append(SectionType.REF, 0)
+
+        with FPFF.open(file_path_1) as fpff:
+            assert extract(fpff, [5, 1], file_path_2) == [1, 2, 3, 5]
+            with self.assertRaises(IndexError):
+                extract(fpff, [7], file_path_2)
+
+        with open(file_path_2, 'rb') as f:
+            fpff = FPFF(f)
+            assert fpff.author == 'jasmaa'
+            assert fpff.svalues == ['b', (1.0, 2.0), 1, 2]
+            assert fpff.resolve(3) == 1
+
+    def test_async(self):
+        fpff_1 = FPFF(author='jasmaa')
+        fpff_1.append(SectionType.ASCII, 'a')
+        fpff_1.append(SectionType.DOUBLES, [0.5, 1.5])
+        fpff_1.append(SectionType.REF, 0)
+        buffer = io.BytesIO()
+        fpff_1.write(buffer)
+        data = buffer.getvalue()
+
+        async def feed(data: bytes) -> asyncio.StreamReader:
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            return reader
+
+        async def read_fed():
+            fpff_2 = await FPFF.aread(await feed(data))
+            assert fpff_2.author == 'jasmaa'
+            assert fpff_2.svalues == fpff_1.svalues
+
+            sections = [s async for s in aiter_sections(await feed(data))]
+            assert sections == [
+                (0, SectionType.ASCII, 'a'),
+                (1, SectionType.DOUBLES, [0.5, 1.5]),
+                (2, SectionType.REF, 0),
+            ]
+
+            with self.assertRaises(ValueError):
+                await FPFF.aread(await feed(data[:-1]))
+
+        asyncio.run(read_fed())
+
+        async def transfer():
+            sock_1, sock_2 = socket.socketpair()
+            reader, reader_writer = await asyncio.open_connection(sock=sock_1)
+            _, writer = await asyncio.open_connection(sock=sock_2)
+
+            # Large enough to fill socket buffers and wait on drain
+            big = 'x' * (1 << 22)
+
+            async def send():
+                async with AsyncFPFFWriter(writer, 3) as fpff_writer:
+                    await fpff_writer.append(SectionType.ASCII, big)
+                    await fpff_writer.append_raw(SectionType.UTF8, b'b')
+                    with self.assertRaises(TypeError):
+                        await fpff_writer.append(SectionType.REF, 'a')
+                    await fpff_writer.append(SectionType.REF, 0)
+                    with self.assertRaises(ValueError):
+                        await fpff_writer.append(SectionType.REF, 0)
+                await fpff_1.awrite(writer)
+                writer.close()
+                await writer.wait_closed()
+
+            async def receive():
+                fpff_2 = await FPFF.aread(reader)
+                fpff_3 = await FPFF.aread(reader)
+                return fpff_2, fpff_3
+
+            _, (fpff_2, fpff_3) = await asyncio.gather(send(), receive())
+            assert fpff_2.svalues == [big, 'b', 0]
+            assert fpff_3.svalues == fpff_1.svalues
+            reader_writer.close()
+            await reader_writer.wait_closed()
+
+        asyncio.run(transfer())
+
 
 if __name__ == '__main__':
     unittest.main()